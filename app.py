@@ -1,68 +1,116 @@
 #!/usr/bin/env python3
 
-import pygame, sys, math
+import argparse
+import pygame, sys, math, random, os
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 from pygame.locals import *
-from random import randrange as rand
+from core import config, colors, Game, Gravity, GarbageRouter, player_seed, set_geometry, randomizers, max_preview, \
+    LEFT, RIGHT, DOWN, DROP_ALL, ROTATE_CW, ROTATE_CCW, RESERVE
+from replay import Recorder
+import snapshot
+from net import net_config
+from spectate import Publisher, start_relay
+from scores import Store, game_record
+from bindings import load_bindings, bind_keys, bind_buttons
+from timing import FrameTimer
 
 pygame.init()
 
-config = {
+config.update({
     'cell_size': 30,
-    'rows': 20,
-    'cols': 10,
     'border_width': 2,
-    'game_state': 'starting',  # gamestates: 0 = starting, 1 = normal, 2 = paused, 3 = gameover
-    'fps': 30,
-    'delay': 1000,
+    'game_state': 'starting',  # starting (menu), normal, paused, gameover, restarting (new game after gameover)
+    'fps': 30,  # frame rate cap, 0 = uncapped
+    'vsync': False,
+    'max_catch_up': 8,  # most sim steps run in one frame before the backlog is dropped
     'd_repeat': 100,
     'num_players': None,
-}
+    'ghost': True,  # outline where the stone will land
+    'font_preload': False,  # load every font size when run() starts instead of on first use
+    'text_cache_size': 256,
+    'bindings_file': 'controls.json',  # optional overrides for bindings.default_bindings
+    'profile': False,  # time each phase of the frame, the trace is written to trace_file on quit
+    'overlay': False,  # show fps, frame time and input latency (F3 toggles)
+    'trace_file': 'trace.json',  # F12 writes the trace so far
+    'seed': None,  # None = new random seed every game
+    'record_file': 'last_game.rec',  # inputs of the last finished game, for replay.py (None = don't record)
+    'display_size': (1280, 720),  # window size, the window can be resized
+    'fullscreen': False,  # F11 toggles
+    'upscale': True,  # grow the boards to fill big windows, otherwise they are only shrunk to fit
+    'save_file': 'saved_game.snap',  # written on every pause, "Continue" in the start menu resumes it
+    'resume': False,
+    'spectate_port': None,  # stream the game to spectate.py watchers on this port (None = off)
+    'scores_file': 'scores.db',  # finished games are kept here for scores.py (None = don't keep them)
+})
+
+bindings = load_bindings(config['bindings_file'])
+frame_timer = FrameTimer(config['profile'] or config['overlay'])
+overlay_state = {'next': 0, 'rect': None}
+
+font_sizes = [20, 40, 50]
+
+window_state = {'changed': True}
+game_states = ('normal', 'paused', 'gameover')  # the states a game scene runs in
+spectate_state = {'relay': None}  # started with the first game, later games restart its stream
+scores_state = {'store': None}
+
+
+def open_window():
+    global main_screen
+    size = config['display_size']
+    flags = pygame.RESIZABLE
+    if config['fullscreen']:
+        flags = pygame.FULLSCREEN
+        if not config['vsync']:
+            size = (0, 0)  # desktop resolution
+    if config['vsync']:
+        main_screen = pygame.display.set_mode(size, flags | pygame.SCALED, vsync=1)
+    else:
+        main_screen = pygame.display.set_mode(size, flags)
+    window_state['changed'] = True
 
-colors = [
-    (0, 0, 0),
-    (255, 0, 0),
-    (0, 150, 0),
-    (0, 0, 255),
-    (255, 120, 0),
-    (255, 255, 0),
-    (180, 0, 255),
-    (0, 220, 220)
-]
 
-shapes = [
-    [[1, 1, 0],
-     [0, 1, 1]],
+def toggle_fullscreen():
+    config['fullscreen'] = not config['fullscreen']
+    open_window()
 
-    [[0, 2, 2],
-     [2, 2, 0]],
 
-    [[3, 3, 3],
-     [0, 3, 0]],
+def window_event(event):
+    # returns True for the events that resize the window
+    global main_screen
+    if event.type == pygame.VIDEORESIZE:
+        if not config['fullscreen']:
+            config['display_size'] = (event.w, event.h)
+        main_screen = pygame.display.get_surface()
+        window_state['changed'] = True
+        return True
+    return False
 
-    [[4, 4, 4],
-     [4, 0, 0]],
 
-    [[5, 5, 5],
-     [0, 0, 5]],
+open_window()
 
-    [[6, 6],
-     [6, 6]],
 
-    [[7, 7, 7, 7]]
-]
-display_width = 1280
-display_height = 720
-main_screen = pygame.display.set_mode((display_width, display_height))
+tiles = {}
+status_stones = {}
+stone_sprites = {}
+scale_maps = {}  # (size, scaled size) -> scale_map
 
 
-def new_board():
-    board = []
-    for y in range(config['rows']):
-        row = []
-        for x in range(config['cols']):
-            row.append(0)
-        board.append(row)
-    return board
+def cell_tile(val):
+    # negative values are the ghost (outline only) of that color
+    if val not in tiles:
+        cs = config['cell_size']
+        tile = pygame.Surface((cs, cs))
+        if val < 0:
+            tile.fill(colors[0])
+            pygame.draw.rect(tile, colors[-val], (1, 1, cs - 2, cs - 2), 2)
+        else:
+            tile.fill(colors[val])
+            pygame.draw.rect(tile, colors[0], (0, 0, cs, cs), 1)
+        tiles[val] = tile
+    return tiles[val]
 
 
 def draw_matrix(surface, matrix, offx, offy, border_width):
@@ -70,52 +118,81 @@ def draw_matrix(surface, matrix, offx, offy, border_width):
     for cy, row in enumerate(matrix):
         for cx, val in enumerate(row):
             if val:
-                pygame.draw.rect(surface, colors[val], (border_width + (offx + cx) * cs,
-                                                        border_width + (offy + cy) * cs, cs, cs), 0)
-                pygame.draw.rect(surface, colors[0], (border_width + (offx + cx) * cs,
-                                                      border_width + (offy + cy) * cs, cs, cs), 1)
-
-
-def rand_stone():
-    return shapes[rand(len(shapes))]
-
-
-def rotate_clockwise(shape):
-    new_shape = []
-    for x in range(len(shape[0])):
-        new_row = []
-        for y in range(len(shape) - 1, -1, -1):
-            new_row.append(shape[y][x])
-        new_shape.append(new_row)
-    return new_shape
+                surface.blit(cell_tile(val), (border_width + (offx + cx) * cs, border_width + (offy + cy) * cs))
 
 
-def rotate_counter_clockwise(shape):
-    new_shape = []
-    for x in range(len(shape[0]) - 1, -1, -1):
-        new_row = []
-        for y in range(len(shape)):
-            new_row.append(shape[y][x])
-        new_shape.append(new_row)
-    return new_shape
-
-
-def check_collision(board, shape, off_x, off_y):
-    for cy, row in enumerate(shape):
-        for cx, val in enumerate(row):
-            try:
-                if val and board[off_y + cy][off_x + cx]:
-                    return True
-            except IndexError:
-                return True
-    return False
+def draw_row(surface, row, y):
+    # redraws one board row of the board layer
+    cs = config['cell_size']
+    top = y * cs
+    surface.fill(colors[0], (0, top, len(row) * cs, cs))
+    for x, val in enumerate(row):
+        if val:
+            surface.blit(cell_tile(val), (x * cs, top))
+
+
+def scale_map(size, scaled):
+    # the source pixel transform.scale picks for each of scaled pixels, read off a scaled strip of indexes.
+    # the same for rows and columns
+    key = (size, scaled)
+    if key not in scale_maps:
+        strip = pygame.Surface((size, 1))
+        for x in range(size):
+            strip.set_at((x, 0), (x >> 8, x & 255, 0))
+        strip = pygame.transform.scale(strip, (scaled, 1))
+        scale_maps[key] = [color.r << 8 | color.g for color in (strip.get_at((x, 0)) for x in range(scaled))]
+    return scale_maps[key]
+
+
+def stone_sprite(stone, ghost=False):
+    # each piece and rotation drawn once, black is see-through
+    key = (stone, ghost)
+    if key not in stone_sprites:
+        cs = config['cell_size']
+        sprite = pygame.Surface((stone.width * cs, stone.height * cs))
+        sprite.set_colorkey(colors[0])
+        for cx, cy, val in stone.cells:
+            sprite.blit(cell_tile(-val if ghost else val), (cx * cs, cy * cs))
+        stone_sprites[key] = sprite
+    return stone_sprites[key]
+
+
+fonts = {}
+text_cache = OrderedDict()
+text_stats = {'font_hits': 0, 'font_misses': 0, 'text_hits': 0, 'text_misses': 0}
+
+
+def get_font(size):
+    if size in fonts:
+        text_stats['font_hits'] += 1
+    else:
+        text_stats['font_misses'] += 1
+        fonts[size] = pygame.font.Font(pygame.font.get_default_font(), size)
+    return fonts[size]
+
+
+def preload_fonts():
+    for size in font_sizes:
+        get_font(size)
+
+
+def render_text(text, size, color=(255, 255, 255)):
+    key = (text, size, color)
+    if key in text_cache:
+        text_stats['text_hits'] += 1
+        text_cache.move_to_end(key)
+        return text_cache[key]
+    text_stats['text_misses'] += 1
+    img = get_font(size).render(text, False, color)
+    text_cache[key] = img
+    if len(text_cache) > config['text_cache_size']:
+        text_cache.popitem(last=False)
+    return img
 
 
 def msg_center(msg, screen):
     for i, line in enumerate(msg.splitlines()):
-        msg_image = pygame.font.Font(
-            pygame.font.get_default_font(), 40).render(
-            line, False, (255, 255, 255))
+        msg_image = render_text(line, 40)
 
         msg_image_x, msg_image_y = msg_image.get_size()
         screen_x, screen_y = screen.get_size()
@@ -124,7 +201,51 @@ def msg_center(msg, screen):
             (screen_y - msg_image_y) // 2))
 
 
+def toggle_overlay():
+    config['overlay'] = not config['overlay']
+    frame_timer.enabled = config['profile'] or config['overlay']
+
+
+def dump_trace():
+    # nothing is timed unless profile or the overlay is on, so the first F12 without them starts recording and
+    # the next one writes what was recorded
+    if not frame_timer.enabled:
+        config['profile'] = True
+        frame_timer.enabled = True
+        print('recording a trace, F12 again writes it to', config['trace_file'])
+        return
+    frame_timer.dump(config['trace_file'])
+
+
+def draw_overlay(screen):
+    # refreshed twice a second, returns the rect that changed or None
+    rect = overlay_state['rect']
+    if not config['overlay']:
+        if rect:
+            screen.fill((0, 0, 0), rect)
+            overlay_state['rect'] = None
+        return rect
+    now = pygame.time.get_ticks()
+    if now < overlay_state['next']:
+        return None
+    overlay_state['next'] = now + 500
+    stats = frame_timer.stats()
+    img = render_text("FPS %.0f  frame p50 %.1fms p99 %.1fms  input p50 %.1fms p99 %.1fms" % (
+        stats['fps'], stats['frame_p50_ms'], stats['frame_p99_ms'], stats['input_p50_ms'], stats['input_p99_ms']), 20)
+    if rect:
+        screen.fill((0, 0, 0), rect)
+    new_rect = screen.blit(img, (10, 10))
+    overlay_state['rect'] = new_rect
+    if rect:
+        return new_rect.union(rect)
+    return new_rect
+
+
 def quit():
+    if config['profile']:
+        dump_trace()
+    if scores_state['store']:
+        scores_state['store'].close()  # finishes writing the queued games
     pygame.display.update()
     pygame.quit()
     sys.exit()
@@ -132,8 +253,7 @@ def quit():
 
 def start_button():
     if config['game_state'] == 'gameover':
-        config['game_state'] = 'normal'
-        run()
+        config['game_state'] = 'restarting'
     elif config['game_state'] == 'normal':
         config['game_state'] = 'paused'
     elif config['game_state'] == 'paused':
@@ -141,61 +261,61 @@ def start_button():
         main_screen.fill((0, 0, 0))
 
 
-def set_speed(lines):
-    threshold = [10, 20, 30, 40, 50, 60, 70, 80, 90]
-    delay = 1000
-    for i in range(len(threshold)):
-        if lines > threshold[i]:
-            delay -= 95
-    pygame.time.set_timer(USEREVENT + 1, delay)
-
-
 def text_line(text):
-    img = pygame.font.Font(pygame.font.get_default_font(), 20).render(text, False, (255, 255, 255))
-    return img
+    return render_text(text, 20)
 
 
-def status_stone(stone):
+def status_stone(stone, small=False):
+    # small = half size, for the previews after the first
+    if (stone, small) in status_stones:
+        return status_stones[(stone, small)]
     tmp_w = config['cell_size'] * 4 + config['border_width'] * 2
     tmp_h = config['cell_size'] * 3 + config['border_width'] * 2
     tmp_surface = pygame.Surface((tmp_w, tmp_h))
     pygame.draw.rect(tmp_surface, (255, 255, 255), (0, 0, tmp_w, tmp_h), config['border_width'])
 
     if stone:
-        stone_w = len(stone[0]) * config['cell_size']
-        stone_h = len(stone) * config['cell_size']
+        stone_w = stone.width * config['cell_size']
+        stone_h = stone.height * config['cell_size']
         stone_surface = pygame.Surface((stone_w, stone_h))
-        draw_matrix(stone_surface, stone, 0, 0, 0)
+        draw_matrix(stone_surface, stone.shape, 0, 0, 0)
 
         tmp_surface.blit(stone_surface, ((tmp_w - stone_w) // 2, (tmp_h - stone_h) // 2))
 
+    if small:
+        tmp_surface = pygame.transform.scale(tmp_surface, (tmp_w // 2, tmp_h // 2))
+    status_stones[(stone, small)] = tmp_surface
     return tmp_surface
 
 
-def rand_lines(players):
-    rcl1 = players[0].rand_line_counter
-    rcl2 = players[1].rand_line_counter
-    if rcl1 - rcl2 > 0:
-        players[1].add_rand_lines(rcl1 - rcl2)
-    elif rcl2 - rcl1 > 0:
-        players[0].add_rand_lines(rcl2 - rcl1)
-    for i, player in enumerate(players):
-        player.rand_line_counter = 0
-
-
 class StartMenu:
-    pointer = pygame.font.Font(pygame.font.get_default_font(), 40).render("->", False, (255, 255, 255))
-    title = pygame.font.Font(pygame.font.get_default_font(), 50).render("TETRIS", False, (255, 255, 255))
-    items = [
-        pygame.font.Font(pygame.font.get_default_font(), 40).render("1 Player", False, (255, 255, 255)),
-        pygame.font.Font(pygame.font.get_default_font(), 40).render("2 Player", False, (255, 255, 255))
-    ]
     buffer = 20
 
-    menu_w = max(items[0].get_width(), items[1].get_width()) + pointer.get_width() + buffer * 2
-    menu_h = (items[0].get_height() + 10) * len(items) + buffer * 2
-
     def __init__(self):
+        self.pointer = render_text("->", 40)
+        self.title = render_text("TETRIS", 50)
+        self.items = [
+            render_text("1 Player", 40),
+            render_text("2 Player", 40)
+        ]
+        self.can_continue = False
+        if config['save_file'] and os.path.exists(config['save_file']):
+            try:
+                snapshot.load_header(config['save_file'])
+                self.can_continue = True
+            except (ValueError, OSError):
+                # cut short, from another version or not a snapshot at all
+                print('removing unusable save file', config['save_file'])
+                try:
+                    os.remove(config['save_file'])
+                except OSError:
+                    pass
+        if self.can_continue:
+            self.items.append(render_text("Continue", 40))
+
+        self.menu_w = max(item.get_width() for item in self.items) + self.pointer.get_width() + self.buffer * 2
+        self.menu_h = (self.items[0].get_height() + 10) * len(self.items) + self.buffer * 2
+
         self.menu = pygame.Surface((self.menu_w, self.menu_h))
         self.selected = 0
         self.update()
@@ -206,7 +326,7 @@ class StartMenu:
         y_pos = self.buffer
         x_pos = self.buffer + self.pointer.get_width()
 
-        main_screen.blit(self.title, ((display_width - self.title.get_width()) // 2, 50))
+        main_screen.blit(self.title, ((main_screen.get_width() - self.title.get_width()) // 2, 50))
 
         for item in self.items:
             self.menu.blit(item, (x_pos, y_pos))
@@ -222,24 +342,28 @@ class StartMenu:
         self.update()
 
     def run_selected(self):
-        config['num_players'] = self.selected + 1
+        if self.selected == 2:
+            config['resume'] = True
+        else:
+            config['num_players'] = self.selected + 1
         config['game_state'] = 'normal'
-        run()
 
 
 class PauseMenu:
-    pointer = pygame.font.Font(pygame.font.get_default_font(), 40).render("->", False, (255, 255, 255))
-    title = pygame.font.Font(pygame.font.get_default_font(), 40).render("Paused", False, (255, 255, 255))
-    items = [
-        pygame.font.Font(pygame.font.get_default_font(), 40).render("Resume", False, (255, 255, 255)),
-        pygame.font.Font(pygame.font.get_default_font(), 40).render("Quit", False, (255, 255, 255))
-    ]
-
     buffer = 20
-    menu_w = max(items[0].get_width(), items[1].get_width()) + pointer.get_width() + buffer * 2
-    menu_h = (items[0].get_height() + 10) * (len(items) + 1) + buffer * 2
 
     def __init__(self):
+        self.pointer = render_text("->", 40)
+        self.title = render_text("Paused", 40)
+        self.items = [
+            render_text("Resume", 40),
+            render_text("Quit", 40)
+        ]
+
+        self.menu_w = max(self.items[0].get_width(), self.items[1].get_width()) + self.pointer.get_width() + \
+            self.buffer * 2
+        self.menu_h = (self.items[0].get_height() + 10) * (len(self.items) + 1) + self.buffer * 2
+
         self.menu = pygame.Surface((self.menu_w, self.menu_h))
         self.selected = 0
         self.update()
@@ -274,39 +398,107 @@ class PauseMenu:
             config['game_state'] = 'normal'
         elif self.selected == 1:
             config['game_state'] = 'starting'
-            run()
-
 
-class Player:
-    board_width = config['cell_size'] * config['cols']
-    board_height = config['cell_size'] * config['rows']
-    status_window_width = config['cell_size'] * 5
-    border_width = config['border_width']
 
-    def __init__(self, id_num):
+class Player(Game):
+    def __init__(self, id_num, seed=None):
         self.id_num = id_num
+        # everything is drawn at cell_size into self.screen, which is scaled as a whole to fit the window
+        self.board_width = config['cell_size'] * config['cols']
+        self.board_height = config['cell_size'] * config['rows']
+        self.status_window_width = config['cell_size'] * 5
+        self.border_width = config['border_width']
         self.screen = pygame.Surface((self.board_width + self.status_window_width + self.border_width * 2,
                                       self.board_height + self.border_width * 2))
         self.status = pygame.Surface((self.status_window_width, self.board_height))
+        self.scaled = None  # self.screen resized for the window, None when it is shown 1:1
+        self.strip = None
+        # the locked cells, only drawn on when the board changes (merge, remove_lines, add_rand_lines)
+        self.layer = pygame.Surface((self.board_width, self.board_height))
+        self.layer_dirty = []  # rects of the layer that changed since they were last copied to self.screen
 
-        self.stone = None
-        self.first_stone = rand_stone()
-        self.second_stone = rand_stone()
-        self.reserved_stone = None
-        self.reserved = False
-
-        self.board = new_board()
-        self.stone_x = 0
-        self.stone_y = 0
-        self.new_stone()
+        self.gravity = None  # set by game_scene(), for the piece timings
+        self.piece_ticks = array('I')  # sim tick each piece locked on
 
-        self.lines = 0
-        self.score = 0
+        Game.__init__(self, seed)
+        self.recorder = None
 
-        self.rand_line_counter = 0
+        # what is currently on self.screen, so update_screen only redraws what changed
+        self.redraw = True
+        self.drawn = []  # (sprite, rect) of the stone and its ghost
+        self.stats_key = None
 
         self.controls = self.set_controls()
 
+    def playing(self):
+        return config['game_state'] == 'normal'
+
+    def step(self, action):
+        # input that arrives while paused or over (joystick repeats, keys queued behind SPACE) is dropped, so the
+        # game only ever changes through what the recorder logs
+        if not self.playing():
+            return self.state()
+        if self.recorder:
+            self.recorder.record(self.id_num, action)
+        return Game.step(self, action)
+
+    def game_over(self):
+        Game.game_over(self)
+        config['game_state'] = 'gameover'
+
+    def set_stone(self, stone):
+        Game.set_stone(self, stone)
+        self.sprite = stone_sprite(stone)
+        self.ghost_sprite = stone_sprite(stone, True)
+
+    def merge(self):
+        Game.merge(self)
+        if self.gravity:
+            self.piece_ticks.append(self.gravity.ticks)
+        cs = config['cell_size']
+        cells = self.board.cells
+        # from the board's colors, the same ones a full draw_layer() would use. board.merge gives the stone's color
+        # to cells garbage pushed into it too, so these are the sprite's colors
+        for cx, cy, val in self.stone.cells:
+            x = self.stone_x + cx
+            y = self.stone_y + cy
+            self.layer.blit(cell_tile(cells[y][x]), (x * cs, y * cs))
+        self.layer_dirty.append(pygame.Rect(self.stone_x * cs, self.stone_y * cs, self.sprite.get_width(),
+                                            self.sprite.get_height()))
+
+    def remove_lines(self):
+        full = self.board.full
+        cleared = [y for y, mask in enumerate(self.board.masks) if mask == full]
+        Game.remove_lines(self)
+        if cleared:
+            cs = config['cell_size']
+            for y in cleared:
+                # everything above a cleared row moves down one row
+                self.layer.set_clip((0, 0, self.board_width, (y + 1) * cs))
+                self.layer.scroll(0, cs)
+                self.layer.set_clip(None)
+                self.layer.fill(colors[0], (0, 0, self.board_width, cs))
+            self.layer_dirty.append(pygame.Rect(0, 0, self.board_width, (cleared[-1] + 1) * cs))
+
+    def add_rand_lines(self, count):
+        Game.add_rand_lines(self, count)
+        count = min(count, self.board.rows)
+        if count:
+            self.layer.scroll(0, -count * config['cell_size'])
+            for y in range(self.board.rows - count, self.board.rows):
+                draw_row(self.layer, self.board.cells[y], y)
+            self.layer_dirty.append(self.layer.get_rect())
+
+    def draw_layer(self):
+        # for boards changed behind the hooks' back, like a loaded snapshot
+        self.layer.fill(colors[0])
+        cs = config['cell_size']
+        for y, row in enumerate(self.board.cells):
+            for x, val in enumerate(row):
+                if val:
+                    self.layer.blit(cell_tile(val), (x * cs, y * cs))
+        self.layer_dirty = [self.layer.get_rect()]
+
     def update_stats(self):
         self.status.fill((0, 0, 0))
         items = [
@@ -316,9 +508,10 @@ class Player:
             text_line("Reserve"),
             status_stone(self.reserved_stone),
             text_line("Next"),
-            status_stone(self.first_stone),
-            status_stone(self.second_stone)
+            status_stone(self.first_stone)
         ]
+        if self.preview == 2:
+            items.append(status_stone(self.second_stone))
 
         y_pos = 10
         for each in items:
@@ -326,128 +519,117 @@ class Player:
             self.status.blit(each, (20, y_pos))
             y_pos += ey + 10
 
-    def rotate_stone_cw(self):
-        new_stone = rotate_clockwise(self.stone)
-        if not check_collision(self.board, new_stone, self.stone_x, self.stone_y):
-            self.stone = new_stone
-
-    def rotate_stone_ccw(self):
-        new_stone = rotate_counter_clockwise(self.stone)
-        if not check_collision(self.board, new_stone, self.stone_x, self.stone_y):
-            self.stone = new_stone
-
-    def reserve_stone(self):
-        if not self.reserved:
-            if self.reserved_stone:
-                temp = self.reserved_stone
-                self.reserved_stone = self.stone
-                self.stone = temp
-            else:
-                self.reserved_stone = self.stone
-                self.new_stone()
-            self.stone_x = (config['cols'] - len(self.stone[0])) // 2
-            self.stone_y = 0
-            self.reserved = True
-
-    def new_stone(self):
-        self.stone = self.first_stone
-        self.first_stone = self.second_stone
-        self.second_stone = rand_stone()
-
-        self.stone_x = (config['cols'] - len(self.stone[0])) // 2
-        self.stone_y = 0
-
-        if check_collision(self.board, self.stone, self.stone_x, self.stone_y):
-            config['game_state'] = 'gameover'
+        # longer previews continue at half size, two to a row
+        if self.preview > 2:
+            for i in range(1, self.preview):
+                img = status_stone(self.queue.peek(i), True)
+                self.status.blit(img, (20 + (i - 1) % 2 * (img.get_width() + 4),
+                                       y_pos + (i - 1) // 2 * (img.get_height() + 4)))
+
+    def invalidate(self):
+        self.redraw = True
+
+    def scale_to(self, size):
+        if size == self.screen.get_size():
+            self.scaled = None
+            self.strip = None
+        else:
+            self.scaled = pygame.Surface(size)
+            self.strip = pygame.Surface((size[0], self.screen.get_height()))  # columns already scaled, for present
+        self.redraw = True
+
+    def present(self, dirty):
+        # returns the surface to show and its changed rects, only the changed rects get scaled
+        if self.scaled is None:
+            return self.screen, dirty
+        width, height = self.screen.get_size()
+        scaled_w, scaled_h = self.scaled.get_size()
+        if self.screen.get_rect() in dirty:
+            pygame.transform.scale(self.screen, (scaled_w, scaled_h), self.scaled)
+            return self.scaled, [self.scaled.get_rect()]
+        # scaling a rect on its own picks slightly different source pixels than scaling the whole screen does, so
+        # the pixels are copied the way the whole screen scale would pick them: columns first, then rows
+        xs = scale_map(width, scaled_w)
+        ys = scale_map(height, scaled_h)
+        rects = []
+        for rect in dirty:
+            left = bisect_left(xs, rect.left)
+            right = bisect_left(xs, rect.right)
+            top = bisect_left(ys, rect.top)
+            bottom = bisect_left(ys, rect.bottom)
+            if left == right or top == bottom:
+                continue
+            self.strip.blits([(self.screen, (x, rect.top), (xs[x], rect.top, 1, rect.h)) for x in range(left, right)],
+                             False)
+            self.scaled.blits([(self.strip, (left, y), (left, ys[y], right - left, 1)) for y in range(top, bottom)],
+                              False)
+            rects.append(pygame.Rect(left, top, right - left, bottom - top))
+        return self.scaled, rects
 
     def update_screen(self):
-        self.screen.fill((0, 0, 0))
-        pygame.draw.rect(self.screen, (255, 255, 255), (0, 0, self.board_width + self.border_width * 2,
-                                                        self.board_height + self.border_width * 2), self.border_width)
-        draw_matrix(self.screen, self.board, 0, 0, self.border_width)
-        draw_matrix(self.screen, self.stone, self.stone_x, self.stone_y, self.border_width)
-        self.update_stats()
-        self.screen.blit(self.status, (self.board_width + self.border_width * 2, self.border_width))
-
-    def merge(self):
-        for cy, row in enumerate(self.stone):
-            for cx, val in enumerate(row):
-                if val:
-                    self.board[self.stone_y + cy][self.stone_x + cx] = val
-
-    def add_rand_lines(self, count):
-        for i in range(count):
-            new_row = []
-            empty_spot = rand(config['cols'])
-            for x in range(config['cols']):
-                if x == empty_spot:
-                    new_row.append(0)
-                else:
-                    new_row.append(rand(1, len(colors)))
-            del (self.board[0])
-            self.board += [new_row]
-
-    def remove_lines(self):
-        count = 0
-        while True:
-            for i, row in enumerate(self.board):
-                if 0 not in row:
-                    del (self.board[i])
-                    self.score += 10 + count * 10
-                    self.lines += 1
-                    count += 1
-                    new_row = []
-                    for x in range(config['cols']):
-                        new_row.append(0)
-                    self.board = [new_row] + self.board
-                    break
-            else:
-                break
-        if count > 0:
-            self.rand_line_counter = count - 1
-
-    def drop(self):
-        if config['game_state'] == 'normal':
-            if check_collision(self.board, self.stone, self.stone_x, self.stone_y + 1):
-                self.merge()
-                self.new_stone()
-                self.remove_lines()
-                self.reserved = False
-            else:
-                self.stone_y += 1
-
-    def drop_all(self):
-        if config['game_state'] == 'normal':
-            if check_collision(self.board, self.stone, self.stone_x, self.stone_y + 1):
-                self.merge()
-                self.new_stone()
-                self.remove_lines()
-                self.reserved = False
-            else:
-                self.stone_y += 1
-                self.drop_all()
-
-    def move(self, direction):
-        new_x = self.stone_x + direction
-        if new_x < 0:
-            new_x = 0
-        if new_x > config['cols'] - len(self.stone[0]):
-            new_x = config['cols'] - len(self.stone[0])
-        if not check_collision(self.board, self.stone, new_x, self.stone_y):
-            self.stone_x = new_x
+        # returns the rects of self.screen that changed since the last call
+        dirty = []
+        full = self.redraw
+        if full:
+            self.screen.fill((0, 0, 0))
+            pygame.draw.rect(self.screen, (255, 255, 255), (0, 0, self.board_width + self.border_width * 2,
+                                                            self.board_height + self.border_width * 2),
+                             self.border_width)
+            self.layer_dirty = [self.layer.get_rect()]
+            self.drawn = []
+            self.stats_key = None
+            self.redraw = False
+            dirty.append(self.screen.get_rect())
+
+        cs = config['cell_size']
+        border = self.border_width
+        rect = pygame.Rect(self.stone_x * cs, self.stone_y * cs, self.sprite.get_width(), self.sprite.get_height())
+        sprites = []
+        if config['ghost']:
+            sprites.append((self.ghost_sprite, rect.move(0, (self.ghost_y() - self.stone_y) * cs)))
+        sprites.append((self.sprite, rect))
+        if sprites != self.drawn or self.layer_dirty:
+            # the layer goes back where the stone was and where it changed, then the stone goes on top
+            areas = []
+            for area in self.layer_dirty + [old for sprite, old in self.drawn] + [new for sprite, new in sprites]:
+                if area not in areas:
+                    areas.append(area)
+                    self.screen.blit(self.layer, (border + area.x, border + area.y), area)
+            for sprite, area in sprites:
+                self.screen.blit(sprite, (border + area.x, border + area.y))
+            if not full:
+                dirty += [area.move(border, border) for area in areas]
+            self.drawn = sprites
+            self.layer_dirty = []
+
+        stats_key = (self.lines, self.score, self.reserved_stone, self.pieces, self.first_stone)
+        if stats_key != self.stats_key:
+            self.stats_key = stats_key
+            frame_timer.begin('update_stats')
+            self.update_stats()
+            frame_timer.end('update_stats')
+            dirty.append(self.screen.blit(self.status, (self.board_width + self.border_width * 2, self.border_width)))
+        return dirty
+
+    def action_table(self):
+        return {
+            'left': lambda: self.step(LEFT),
+            'right': lambda: self.step(RIGHT),
+            'down': lambda: self.step(DOWN),
+            'drop_all': lambda: self.step(DROP_ALL),
+            'rotate_cw': lambda: self.step(ROTATE_CW),
+            'rotate_ccw': lambda: self.step(ROTATE_CCW),
+            'reserve': lambda: self.step(RESERVE),
+            'start': start_button,
+            'quit': quit,
+            'overlay': toggle_overlay,
+            'trace': dump_trace,
+            'fullscreen': toggle_fullscreen
+        }
 
     def set_controls(self):
         controls = {
-            'joy_button_actions': {
-                0: self.rotate_stone_cw,  # A button
-                1: self.rotate_stone_ccw,  # B button
-                # 2: None,                    # X button
-                # 3: None,                    # Y button
-                4: self.reserve_stone,  # L1 button
-                5: self.reserve_stone,  # R1 button
-                # 6: None,                    # select button
-                7: start_button  # start button
-            },
+            'joy_button_actions': bind_buttons(bindings['joy_buttons'], self.action_table()),
             'joy_hat_actions': {
                 'd_pad': (0, 0)
             },
@@ -459,17 +641,20 @@ class Player:
         }
         return controls
 
+    def shift(self, direction):
+        if direction < 0:
+            self.step(LEFT)
+        elif direction > 0:
+            self.step(RIGHT)
+
     def handle_event(self, event):
-        if event.type == USEREVENT + 1:
-            self.drop()
-        elif event.type == pygame.JOYBUTTONDOWN:
-            for key in self.controls['joy_button_actions']:
-                if key == event.button:
-                    self.controls['joy_button_actions'][event.button]()
+        if event.type == pygame.JOYBUTTONDOWN:
+            if event.button in self.controls['joy_button_actions']:
+                self.controls['joy_button_actions'][event.button]()
         elif event.type == pygame.JOYHATMOTION:
             self.controls['joy_hat_actions'][0] = event.value
             if event.value[1] == 1:
-                self.drop_all()
+                self.step(DROP_ALL)
             elif event.value == (0, 0):
                 pygame.time.set_timer(USEREVENT + 2 + self.id_num, 0)
             else:
@@ -487,157 +672,316 @@ class Player:
                     pygame.time.set_timer(USEREVENT + 4 + self.id_num, config['d_repeat'])
                 elif event.value < -0.6 and self.controls['joy_axis_actions']['ready']:
                     self.controls['joy_axis_actions'][event.axis] = -1
-                    self.drop_all()
+                    self.step(DROP_ALL)
                     self.controls['joy_axis_actions']['ready'] = False
                 elif abs(event.value) < 0.6:
                     self.controls['joy_axis_actions'][event.axis] = 0
                     self.controls['joy_axis_actions']['ready'] = True
         elif event.type == USEREVENT + 2 + self.id_num:
             if self.controls['joy_hat_actions'][0][0] != 0:
-                self.move(self.controls['joy_hat_actions'][0][0])
+                self.shift(self.controls['joy_hat_actions'][0][0])
             if self.controls['joy_hat_actions'][0][1] == -1:
-                self.drop()
+                self.step(DOWN)
         elif event.type == USEREVENT + 4 + self.id_num:
             if self.controls['joy_axis_actions'][0] != 0:
-                self.move(self.controls['joy_axis_actions'][0])
+                self.shift(self.controls['joy_axis_actions'][0])
             if self.controls['joy_axis_actions'][1] == 1:
-                self.drop()
+                self.step(DOWN)
+
+
+def layout(players):
+    # splits the window between the players and scales each screen to its slot, returns their positions
+    screen_w, screen_h = main_screen.get_size()
+    slot_w = screen_w // len(players)
+    places = []
+    for i, player in enumerate(players):
+        width, height = player.screen.get_size()
+        scale = min(slot_w / width, screen_h / height)
+        if not config['upscale']:
+            scale = min(scale, 1.0)
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        player.scale_to(size)
+        places.append(((slot_w - size[0]) // 2 + i * slot_w, (screen_h - size[1]) // 2))
+    return places
 
 
 def run():
-    main_screen.fill((0, 0, 0))
+    # one scene at a time, the start menu or a game (playing, paused and game over). menus and buttons only
+    # change config['game_state'], the scene they are in sees it and returns, and everything it made goes
+    # with it before the next scene starts
+    if config['font_preload']:
+        preload_fonts()
     pygame.key.set_repeat(250, 100)
     pygame.event.set_blocked(MOUSEMOTION)
 
-    fps_limit = pygame.time.Clock()
+    clock = pygame.time.Clock()
 
     joysticks = []
     for i in range(pygame.joystick.get_count()):
-        joysticks.append(pygame.joystick.Joystick(i).init())
-
-    if config['game_state'] == 'starting':
-        start_menu = StartMenu()
-        menu_window = start_menu.menu
-
-        key_actions = {
-            'ESCAPE': quit,
-            'DOWN': lambda: start_menu.move_pointer(1),
-            'UP': lambda: start_menu.move_pointer(-1),
-            'SPACE': start_menu.run_selected
-        }
-
-        while config['game_state'] == 'starting':
-            start_w, start_h = menu_window.get_size()
-            main_screen.blit(menu_window,
-                             ((display_width - start_w) // 2,
-                              (display_height - start_h) // 2))
-            pygame.display.update()
+        joystick = pygame.joystick.Joystick(i)
+        joystick.init()
+        joysticks.append(joystick)
 
+    while True:
+        main_screen.fill((0, 0, 0))
+        if config['game_state'] == 'starting':
+            menu_scene(clock)
+        else:
+            if config['game_state'] == 'restarting':
+                config['game_state'] = 'normal'
+            # a resumed game brings its own board size, later games go back to the one we had
+            board_size = (config['rows'], config['cols'])
+            game_scene(clock)
+            set_geometry(*board_size)
+
+
+def menu_scene(clock):
+    window_state['changed'] = True
+    start_menu = StartMenu()
+    menu_window = start_menu.menu
+
+    key_actions = bind_keys(bindings['menu'], {
+        'quit': quit,
+        'down': lambda: start_menu.move_pointer(1),
+        'up': lambda: start_menu.move_pointer(-1),
+        'select': start_menu.run_selected,
+        'fullscreen': toggle_fullscreen
+    })
+
+    while config['game_state'] == 'starting':
+        if window_state['changed']:
+            window_state['changed'] = False
+            main_screen.fill((0, 0, 0))
+            start_menu.update()
+        start_w, start_h = menu_window.get_size()
+        screen_w, screen_h = main_screen.get_size()
+        main_screen.blit(menu_window, ((screen_w - start_w) // 2, (screen_h - start_h) // 2))
+        pygame.display.update()
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                quit()
+            elif window_event(event):
+                pass
+            elif event.type == pygame.KEYDOWN:
+                if event.key in key_actions:
+                    key_actions[event.key]()
+            elif event.type == pygame.JOYHATMOTION:
+                start_menu.move_pointer(event.value[1])
+            elif event.type == pygame.JOYAXISMOTION:
+                if event.axis == 1:
+                    if abs(event.value) > 0.9:
+                        start_menu.move_pointer(int(event.value))
+            elif event.type == pygame.JOYBUTTONDOWN:
+                if event.button == 0:
+                    start_menu.run_selected()
+
+        clock.tick(config['fps'])
+
+
+def game_scene(clock):
+    saved = config['resume']
+    if saved:
+        config['resume'] = False
+        values = snapshot.load_header(config['save_file'])
+        config['rows'], config['cols'], config['num_players'] = values[2:5]
+        seed = values[8]
+    set_geometry(config['rows'], config['cols'])
+    if not saved:
+        seed = config['seed']
+        if seed is None:
+            seed = random.randrange(1 << 32)
+    recorder = None
+    # a resumed game can't be replayed from its seed, so it isn't recorded
+    if config['record_file'] and not saved:
+        recorder = Recorder(config['num_players'], seed, config['sim_hz'], config['delay'],
+                            config['garbage_target'])
+
+    players = []
+    for i in range(config['num_players']):
+        players.append(Player(i, player_seed(seed, i)))
+        players[i].recorder = recorder
+
+    pause_menu = PauseMenu()
+
+    pause_keys = bind_keys(bindings['menu'], {
+        'quit': quit,
+        'down': lambda: pause_menu.move_pointer(1),
+        'up': lambda: pause_menu.move_pointer(-1),
+        'select': pause_menu.run_selected,
+        'fullscreen': toggle_fullscreen
+    })
+    game_keys = bind_keys(bindings['game'], players[0].action_table())
+    places = []
+    window_state['changed'] = True
+    key_actions = game_keys
+
+    # gravity runs off a fixed step accumulator instead of a pygame timer, so slow frames don't stretch it
+    gravity = Gravity(config['sim_hz'], router=GarbageRouter(seed))
+    for player in players:
+        player.gravity = gravity
+    if saved:
+        snapshot.load(config['save_file'], players, gravity)
+        for player in players:
+            player.draw_layer()
+    accumulator = 0.0
+
+    publisher = None
+    published = gravity.ticks
+    if config['spectate_port']:
+        publisher = Publisher(players, seed, config['sim_hz'], config['delay'])
+        if spectate_state['relay']:
+            spectate_state['relay'].restart_threadsafe(publisher.hello)
+        else:
+            spectate_state['relay'] = start_relay(publisher.hello, '0.0.0.0', config['spectate_port'])
+
+    last_state = config['game_state']
+    while config['game_state'] in game_states:
+        frame_timer.start_frame()
+        update_rects = None
+        full_update = False
+        if window_state['changed']:
+            window_state['changed'] = False
+            main_screen.fill((0, 0, 0))
+            places = layout(players)
+            full_update = True
+        if config['game_state'] != last_state:
+            last_state = config['game_state']
+            if last_state == 'normal':
+                main_screen.fill((0, 0, 0))
+                for player in players:
+                    player.invalidate()
+            elif last_state == 'paused' and config['save_file']:
+                snapshot.save(config['save_file'], players, gravity, seed)
+            elif last_state == 'gameover':
+                if recorder:
+                    recorder.save(config['record_file'])
+                if config['scores_file']:
+                    if not scores_state['store']:
+                        scores_state['store'] = Store(config['scores_file'])
+                    winner = None
+                    if len(players) > 1:
+                        winner = next((player.id_num for player in players if not player.over), None)
+                    scores_state['store'].record(game_record(players, seed, 'local', config['sim_hz'],
+                                                             gravity.ticks, winner))
+                if config['save_file'] and os.path.exists(config['save_file']):
+                    os.remove(config['save_file'])
+
+        if config['game_state'] == 'gameover':
+            msg_center("GAME OVER!", main_screen)
+
+        elif config['game_state'] == 'paused':
+            pause_w, pause_h = pause_menu.menu.get_size()
+            screen_w, screen_h = main_screen.get_size()
+            main_screen.blit(pause_menu.menu, ((screen_w - pause_w) // 2, (screen_h - pause_h) // 2))
+            key_actions = pause_keys
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     quit()
+                elif window_event(event):
+                    pass
                 elif event.type == pygame.KEYDOWN:
-                    for key in key_actions:
-                        if event.key == eval("pygame.K_" + key):
-                            key_actions[key]()
+                    if event.key in key_actions:
+                        key_actions[event.key]()
                 elif event.type == pygame.JOYHATMOTION:
-                    start_menu.move_pointer(event.value[1])
+                    pause_menu.move_pointer(event.value[1])
                 elif event.type == pygame.JOYAXISMOTION:
                     if event.axis == 1:
                         if abs(event.value) > 0.9:
-                            start_menu.move_pointer(int(event.value))
+                            pause_menu.move_pointer(int(event.value))
                 elif event.type == pygame.JOYBUTTONDOWN:
                     if event.button == 0:
-                        start_menu.run_selected()
-
-            fps_limit.tick(config['fps'])
-
-    else:
-        players = []
-        for i in range(config['num_players']):
-            players.append(Player(i))
-
-        pause_menu = PauseMenu()
-
-        pygame.time.set_timer(USEREVENT + 1, config['delay'])
-
-        while True:
-            if config['game_state'] == 'gameover':
-                msg_center("GAME OVER!", main_screen)
-
-            elif config['game_state'] == 'paused':
-                pause_w, pause_h = pause_menu.menu.get_size()
-                main_screen.blit(pause_menu.menu,
-                                 ((display_width - pause_w) // 2,
-                                  (display_height - pause_h) // 2))
-                key_actions = {
-                    'ESCAPE': quit,
-                    'DOWN': lambda: pause_menu.move_pointer(1),
-                    'UP': lambda: pause_menu.move_pointer(-1),
-                    'SPACE': pause_menu.run_selected
-                }
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        quit()
-                    elif event.type == pygame.KEYDOWN:
-                        for key in key_actions:
-                            if event.key == eval("pygame.K_" + key):
-                                key_actions[key]()
-                    elif event.type == pygame.JOYHATMOTION:
-                        pause_menu.move_pointer(event.value[1])
-                    elif event.type == pygame.JOYAXISMOTION:
-                        if event.axis == 1:
-                            if abs(event.value) > 0.9:
-                                pause_menu.move_pointer(int(event.value))
-                    elif event.type == pygame.JOYBUTTONDOWN:
-                        if event.button == 0:
-                            pause_menu.run_selected()
-
-            else:  # gamestate = normal
-                key_actions = {
-                    'ESCAPE': quit,
-                    'LEFT': lambda: players[0].move(-1),
-                    'RIGHT': lambda: players[0].move(+1),
-                    'DOWN': players[0].drop,
-                    'UP': players[0].rotate_stone_ccw,
-                    'SPACE': start_button
-                }
-                for i, player in enumerate(players):
-                    player.update_screen()
-                    main_x = display_width // len(players)
-                    player_x, player_y = player.screen.get_size()
-                    main_screen.blit(player.screen, (
-                        (main_x - player_x) // 2 + i * main_x,
-                        (display_height - player_y) // 2))
+                        pause_menu.run_selected()
+
+        else:  # gamestate = normal
+            key_actions = game_keys
+            update_rects = []
+            for player, pos in zip(players, places):
+                frame_timer.begin('update_screen')
+                dirty = player.update_screen()
+                frame_timer.end('update_screen')
+                frame_timer.begin('blit')
+                surface, dirty = player.present(dirty)
+                for rect in dirty:
+                    update_rects.append(main_screen.blit(surface, (pos[0] + rect.x, pos[1] + rect.y), rect))
+                frame_timer.end('blit')
+            overlay_rect = draw_overlay(main_screen)
+            if overlay_rect:
+                update_rects.append(overlay_rect)
+        frame_timer.begin('display_update')
+        if update_rects is None or full_update:
             pygame.display.update()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    quit()
-                elif event.type == pygame.KEYDOWN:
-                    for key in key_actions:
-                        if event.key == eval("pygame.K_" + key):
-                            key_actions[key]()
-                elif event.type == pygame.JOYBUTTONDOWN:
-                    players[event.joy].handle_event(event)
-                elif event.type == pygame.JOYHATMOTION:
-                    players[event.joy].handle_event(event)
-                elif event.type == pygame.JOYAXISMOTION:
-                    players[event.joy].handle_event(event)
-                elif event.type == USEREVENT + 1:
-                    if len(players) == 2:
-                        rand_lines(players)
-                    lines = 0
-                    for i, player in enumerate(players):
-                        player.handle_event(event)
-                        lines += player.lines
-                    set_speed(lines)
-                else:
-                    for i, player in enumerate(players):
-                        player.handle_event(event)
-
-            fps_limit.tick(config['fps'])
+        elif update_rects:
+            pygame.display.update(update_rects)
+        frame_timer.end('display_update')
+        frame_timer.presented()
+
+        frame_timer.begin('events')
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                quit()
+            elif window_event(event):
+                pass
+            elif event.type == pygame.KEYDOWN:
+                frame_timer.input()
+                if event.key in key_actions:
+                    key_actions[event.key]()
+            elif event.type == pygame.JOYBUTTONDOWN:
+                frame_timer.input()
+                players[event.joy].handle_event(event)
+            elif event.type == pygame.JOYHATMOTION:
+                frame_timer.input()
+                players[event.joy].handle_event(event)
+            elif event.type == pygame.JOYAXISMOTION:
+                players[event.joy].handle_event(event)
+            else:
+                for i, player in enumerate(players):
+                    player.handle_event(event)
+        frame_timer.end('events')
+
+        frame_timer.begin('sim')
+        steps = 0
+        while config['game_state'] == 'normal' and accumulator >= gravity.step_ms:
+            if steps == config['max_catch_up']:
+                accumulator = 0.0
+                break
+            gravity.step(players)
+            if recorder:
+                recorder.tick = gravity.ticks
+            accumulator -= gravity.step_ms
+            steps += 1
+        if publisher and gravity.ticks - published >= net_config['send_every']:
+            published = gravity.ticks
+            spectate_state['relay'].publish_threadsafe(publisher.publish(gravity.ticks))
+        frame_timer.end('sim')
+        frame_timer.end_frame()
+
+        frame_ms = clock.tick(config['fps'])
+        if config['game_state'] == 'normal':
+            accumulator += frame_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tetris')
+    parser.add_argument('--rows', type=int, default=config['rows'])
+    parser.add_argument('--cols', type=int, default=config['cols'])
+    parser.add_argument('--size', default='%dx%d' % config['display_size'], help='window size, e.g. 1920x1080')
+    parser.add_argument('--fullscreen', action='store_true')
+    parser.add_argument('--randomizer', choices=randomizers, default=config['randomizer'])
+    parser.add_argument('--preview', type=int, choices=range(1, max_preview + 1), default=config['preview'])
+    parser.add_argument('--spectate', type=int, metavar='PORT', help='let spectate.py watch the game on this port')
+    args = parser.parse_args()
+
+    set_geometry(args.rows, args.cols)
+    config['randomizer'] = args.randomizer
+    config['preview'] = args.preview
+    config['display_size'] = tuple(int(n) for n in args.size.split('x'))
+    config['fullscreen'] = args.fullscreen
+    if args.spectate:
+        config['spectate_port'] = args.spectate
+    open_window()
+    run()
 
 
 if __name__ == "__main__":
-    run()
+    main()
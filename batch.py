@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# steps N single player games at once, all boards live in one (N, rows, cols) uint8 array
+# needs numpy - same rules and action codes as core.Game
+
+from collections import namedtuple
+
+import numpy as np
+
+from core import config, pieces, LEFT, RIGHT, DOWN, DROP_ALL, ROTATE_CW, ROTATE_CCW, RESERVE
+
+BatchState = namedtuple('BatchState', ['boards', 'piece', 'rotation', 'stone_x', 'stone_y', 'first_stone',
+                                       'second_stone', 'reserved_stone', 'lines', 'score', 'over'])
+
+wall = 255
+
+
+def piece_arrays():
+    # core.pieces padded top-left into 4x4 so rotating keeps the same anchor as core
+    cells = np.zeros((len(pieces), 4, 4, 4), np.uint8)
+    widths = np.zeros((len(pieces), 4), np.int64)
+    for p, rotations in enumerate(pieces):
+        for r, piece in enumerate(rotations):
+            cells[p, r, :piece.height, :piece.width] = piece.shape
+            widths[p, r] = piece.width
+    return cells, widths
+
+
+class BatchGame:
+    def __init__(self, n, seed=None, randomizer=None):
+        self.n = n
+        self.rows = config['rows']
+        self.cols = config['cols']
+        self.cells, self.widths = piece_arrays()
+        self.rng = np.random.default_rng(seed)
+        self.randomizer = randomizer or config['randomizer']
+        if self.randomizer not in ('bag', 'random'):
+            raise ValueError("batch games support the bag and random randomizers")
+        # the bag each board is drawing from and how far into it it is
+        self.bags = np.zeros((n, len(pieces)), np.int64)
+        self.bag_pos = np.zeros(n, np.int64)
+
+        # 4 extra wall rows/cols on the bottom/right so a 4x4 window never leaves the array
+        self.grid = np.zeros((n, self.rows + 4, self.cols + 4), np.uint8)
+        self.grid[:, self.rows:, :] = wall
+        self.grid[:, :, self.cols:] = wall
+        self.boards = self.grid[:, :self.rows, :self.cols]
+
+        self.piece = np.zeros(n, np.int64)
+        self.rotation = np.zeros(n, np.int64)
+        self.stone_x = np.zeros(n, np.int64)
+        self.stone_y = np.zeros(n, np.int64)
+        self.first_stone = np.zeros(n, np.int64)
+        self.second_stone = np.zeros(n, np.int64)
+        self.reserved_piece = np.zeros(n, np.int64)
+        self.reserved_rotation = np.zeros(n, np.int64)
+        self.reserved = np.zeros(n, bool)
+        self.lines = np.zeros(n, np.int64)
+        self.score = np.zeros(n, np.int64)
+        self.rand_line_counter = np.zeros(n, np.int64)
+        self.over = np.zeros(n, bool)
+
+        self.dy = np.arange(4)[None, :, None]
+        self.dx = np.arange(4)[None, None, :]
+        self.reset()
+
+    def reset(self, idx=None):
+        if idx is None:
+            idx = np.arange(self.n)
+        idx = np.asarray(idx, np.int64)
+        self.boards[idx] = 0
+        self.bag_pos[idx] = len(pieces)
+        self.first_stone[idx] = self.draw(idx)
+        self.second_stone[idx] = self.draw(idx)
+        self.reserved_piece[idx] = -1
+        self.reserved_rotation[idx] = 0
+        self.reserved[idx] = False
+        self.lines[idx] = 0
+        self.score[idx] = 0
+        self.rand_line_counter[idx] = 0
+        self.over[idx] = False
+        self.new_stones(idx)
+        return self.state()
+
+    def state(self):
+        return BatchState(self.boards, self.piece, self.rotation, self.stone_x, self.stone_y, self.first_stone,
+                          self.second_stone, self.reserved_piece, self.lines, self.score, self.over)
+
+    def windows(self, idx, x, y):
+        return idx[:, None, None], y[:, None, None] + self.dy, x[:, None, None] + self.dx
+
+    def collides(self, idx, piece, rotation, x, y):
+        window = self.grid[self.windows(idx, x, y)]
+        return ((window != 0) & (self.cells[piece, rotation] != 0)).any(axis=(1, 2))
+
+    def draw(self, idx):
+        if self.randomizer == 'random':
+            return self.rng.integers(len(pieces), size=len(idx))
+        empty = idx[self.bag_pos[idx] == len(pieces)]
+        if len(empty):
+            self.bags[empty] = self.rng.permuted(np.tile(np.arange(len(pieces)), (len(empty), 1)), axis=1)
+            self.bag_pos[empty] = 0
+        drawn = self.bags[idx, self.bag_pos[idx]]
+        self.bag_pos[idx] += 1
+        return drawn
+
+    def new_stones(self, idx):
+        self.piece[idx] = self.first_stone[idx]
+        self.rotation[idx] = 0
+        self.first_stone[idx] = self.second_stone[idx]
+        self.second_stone[idx] = self.draw(idx)
+
+        self.stone_x[idx] = (self.cols - self.widths[self.piece[idx], 0]) // 2
+        self.stone_y[idx] = 0
+
+        self.over[idx] |= self.collides(idx, self.piece[idx], self.rotation[idx], self.stone_x[idx], self.stone_y[idx])
+
+    def move(self, idx, direction):
+        piece = self.piece[idx]
+        rotation = self.rotation[idx]
+        x = np.clip(self.stone_x[idx] + direction, 0, self.cols - self.widths[piece, rotation])
+        ok = ~self.collides(idx, piece, rotation, x, self.stone_y[idx])
+        self.stone_x[idx[ok]] = x[ok]
+
+    def rotate(self, idx, turns):
+        rotation = (self.rotation[idx] + turns) % 4
+        ok = ~self.collides(idx, self.piece[idx], rotation, self.stone_x[idx], self.stone_y[idx])
+        self.rotation[idx[ok]] = rotation[ok]
+
+    def reserve_stones(self, idx):
+        idx = idx[~self.reserved[idx]]
+        swap = idx[self.reserved_piece[idx] >= 0]
+        fresh = idx[self.reserved_piece[idx] < 0]
+
+        piece = self.piece[swap]
+        rotation = self.rotation[swap]
+        self.piece[swap] = self.reserved_piece[swap]
+        self.rotation[swap] = self.reserved_rotation[swap]
+        self.reserved_piece[swap] = piece
+        self.reserved_rotation[swap] = rotation
+
+        self.reserved_piece[fresh] = self.piece[fresh]
+        self.reserved_rotation[fresh] = self.rotation[fresh]
+        self.new_stones(fresh)
+
+        self.stone_x[idx] = (self.cols - self.widths[self.piece[idx], self.rotation[idx]]) // 2
+        self.stone_y[idx] = 0
+        self.reserved[idx] = True
+
+    def drop(self, idx):
+        landed = self.collides(idx, self.piece[idx], self.rotation[idx], self.stone_x[idx], self.stone_y[idx] + 1)
+        self.stone_y[idx[~landed]] += 1
+        self.lock(idx[landed])
+
+    def drop_all(self, idx):
+        falling = idx
+        while len(falling):
+            ok = ~self.collides(falling, self.piece[falling], self.rotation[falling], self.stone_x[falling],
+                                self.stone_y[falling] + 1)
+            falling = falling[ok]
+            self.stone_y[falling] += 1
+        self.lock(idx)
+
+    def lock(self, idx):
+        if len(idx):
+            window = self.windows(idx, self.stone_x[idx], self.stone_y[idx])
+            stone = self.cells[self.piece[idx], self.rotation[idx]]
+            self.grid[window] = np.where(stone != 0, stone, self.grid[window])
+            self.new_stones(idx)
+            self.remove_lines(idx)
+            self.reserved[idx] = False
+
+    def remove_lines(self, idx):
+        boards = self.boards[idx]
+        full = (boards != 0).all(axis=2)
+        count = full.sum(axis=1)
+        hit = count > 0
+        if hit.any():
+            idx, boards, full, count = idx[hit], boards[hit], full[hit], count[hit]
+            # full rows sort to the top (stable, so the rest keep their order) and are then emptied
+            order = np.argsort(~full, axis=1, kind='stable')
+            boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+            boards[np.arange(self.rows)[None, :] < count[:, None]] = 0
+            self.boards[idx] = boards
+
+            self.score[idx] += 10 * count + 5 * count * (count - 1)
+            self.lines[idx] += count
+            self.rand_line_counter[idx] = count - 1
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        live = ~self.over
+        for code, handler, arg in ((LEFT, self.move, -1), (RIGHT, self.move, +1),
+                                   (ROTATE_CW, self.rotate, 1), (ROTATE_CCW, self.rotate, 3)):
+            idx = np.flatnonzero(live & (actions == code))
+            if len(idx):
+                handler(idx, arg)
+        for code, handler in ((RESERVE, self.reserve_stones), (DOWN, self.drop), (DROP_ALL, self.drop_all)):
+            idx = np.flatnonzero(live & (actions == code))
+            if len(idx):
+                handler(idx)
+        return self.state()
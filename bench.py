@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# engine and renderer benchmarks, replaying seeded random moves headlessly
+#   python bench.py --seed 1 --moves 20000 --frames 2000 --out bench.json
+# compare two json files from different versions to catch regressions
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import core
+from timing import percentile
+
+bench_actions = [core.LEFT, core.RIGHT, core.DOWN, core.DOWN, core.DOWN, core.DROP_ALL, core.ROTATE_CW,
+                 core.ROTATE_CCW, core.RESERVE]
+
+
+def move_list(seed, moves):
+    rng = random.Random(seed)
+    return [rng.choice(bench_actions) for i in range(moves)]
+
+
+def replay(game, moves, seed, garbage_every=50):
+    # plays the moves, adds garbage now and then, restarts the game when it tops out
+    games = 1
+    for i, action in enumerate(moves):
+        game.step(action)
+        if garbage_every and i % garbage_every == 0:
+            game.add_rand_lines(1)
+        if game.over:
+            game.__init__(seed + games)
+            games += 1
+    return games
+
+
+class Timer:
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        result = self.fn(*args)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return result
+
+    def result(self):
+        return {
+            'calls': self.calls,
+            'ops_per_sec': self.calls / self.seconds if self.seconds else 0.0,
+            'mean_ns': self.seconds / self.calls * 1e9 if self.calls else 0.0
+        }
+
+
+def bench_engine(seed, moves):
+    results = {}
+    move_seq = move_list(seed, moves)
+
+    game = core.Game(seed)
+    start = time.perf_counter()
+    games = replay(game, move_seq, seed)
+    elapsed = time.perf_counter() - start
+    results['step'] = {'calls': moves, 'games': games, 'ops_per_sec': moves / elapsed, 'mean_ns': elapsed / moves * 1e9}
+
+    # per function timings, wrapped around the same replay
+    game = core.Game(seed)
+    timers = {'check_collision': Timer(core.check_collision)}
+    for name in ['merge', 'remove_lines', 'add_rand_lines', 'new_stone']:
+        timers[name] = Timer(getattr(game, name))
+        setattr(game, name, timers[name])
+    core.check_collision = timers['check_collision']
+    try:
+        replay(game, move_seq, seed)
+    finally:
+        core.check_collision = timers['check_collision'].fn
+    for name, timer in timers.items():
+        results[name] = timer.result()
+
+    timer = Timer(core.rotate_clockwise)
+    for i in range(moves):
+        timer(core.shapes[i % len(core.shapes)])
+    results['rotate_clockwise'] = timer.result()
+
+    results['allocations'] = bench_allocations(seed, move_seq[:min(moves, 5000)])
+    return results
+
+
+def bench_allocations(seed, moves):
+    game = core.Game(seed)
+    peaks = []
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    for i, action in enumerate(moves):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        game.step(action)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        if game.over:
+            game.__init__(seed + i)
+    tracemalloc.stop()
+    return {
+        'ticks': len(moves),
+        'peak_bytes_per_tick_mean': sum(peaks) / len(peaks),
+        'peak_bytes_per_tick_p99': percentile(peaks, 99),
+        'net_blocks_per_tick': (sys.getallocatedblocks() - blocks) / len(moves)
+    }
+
+
+def bench_render(seed, frames):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import app
+
+    results = {}
+    move_seq = move_list(seed, frames)
+    for mode in ['dirty', 'full']:
+        app.config['game_state'] = 'normal'
+        player = app.Player(0, seed)
+        times = []
+        for i, action in enumerate(move_seq):
+            player.step(action)
+            if app.config['game_state'] != 'normal':
+                app.config['game_state'] = 'normal'
+                player = app.Player(0, seed + i)
+            if mode == 'full':
+                player.invalidate()
+            start = time.perf_counter()
+            player.update_screen()
+            times.append((time.perf_counter() - start) * 1000)
+        results[mode] = {
+            'frames': frames,
+            'fps': frames / (sum(times) / 1000),
+            'p50_ms': percentile(times, 50),
+            'p90_ms': percentile(times, 90),
+            'p99_ms': percentile(times, 99),
+            'max_ms': max(times)
+        }
+    results['text_cache'] = dict(app.text_stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the game engine and renderer')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--moves', type=int, default=20000)
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--no-render', action='store_true', help='skip the renderer (no pygame needed)')
+    parser.add_argument('--out', help='write the results to this json file')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'seed': args.seed,
+        'engine': bench_engine(args.seed, args.moves)
+    }
+    if not args.no_render:
+        results['render'] = bench_render(args.seed, args.frames)
+
+    for section in ['engine', 'render']:
+        for name, result in results.get(section, {}).items():
+            print(section, name, ' '.join('%s=%.6g' % (key, val) for key, val in result.items()))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# key/button bindings - names are resolved to keycodes once, events are then dispatched with one dict lookup
+# any part of the defaults can be overridden from a json file, e.g.
+#   {"game": {"UP": "rotate_cw", "x": "reserve"}, "joy_buttons": {"2": "drop_all"}}
+
+import json
+import os
+
+import pygame
+
+default_bindings = {
+    'menu': {
+        'ESCAPE': 'quit',
+        'DOWN': 'down',
+        'UP': 'up',
+        'SPACE': 'select',
+        'F11': 'fullscreen'
+    },
+    'game': {
+        'ESCAPE': 'quit',
+        'LEFT': 'left',
+        'RIGHT': 'right',
+        'DOWN': 'down',
+        'UP': 'rotate_ccw',
+        'SPACE': 'start',
+        'F3': 'overlay',
+        'F12': 'trace',
+        'F11': 'fullscreen'
+    },
+    'joy_buttons': {
+        '0': 'rotate_cw',  # A button
+        '1': 'rotate_ccw',  # B button
+        '4': 'reserve',  # L1 button
+        '5': 'reserve',  # R1 button
+        '7': 'start'  # start button
+    }
+}
+
+
+def load_bindings(path):
+    bindings = {}
+    for section in default_bindings:
+        bindings[section] = dict(default_bindings[section])
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for section, items in json.load(f).items():
+                bindings.setdefault(section, {}).update(items)
+    return bindings
+
+
+def key_code(name):
+    if hasattr(pygame, 'K_' + name):
+        return getattr(pygame, 'K_' + name)
+    return pygame.key.key_code(name)
+
+
+def bind_keys(names, actions):
+    # names: key name -> action name, actions: action name -> callable
+    table = {}
+    for name, action in names.items():
+        if action in actions:
+            try:
+                code = key_code(name)
+            except ValueError:
+                # a typo in the bindings file, the action still has its default keys
+                print('ignoring binding for unknown key', repr(name))
+                continue
+            table[code] = actions[action]
+    return table
+
+
+def bind_buttons(names, actions):
+    table = {}
+    for button, action in names.items():
+        if action in actions:
+            try:
+                table[int(button)] = actions[action]
+            except ValueError:
+                print('ignoring binding for unknown button', repr(button))
+    return table
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+# placement search bot
+# every placement reachable by rotating in place, shifting and hard dropping is scored with a pluggable
+# heuristic, looking ahead through the preview queue. board evaluations and searched nodes are cached by
+# board, and the search deepens one piece at a time until it runs out of pieces or time.
+#   python bot.py --games 20 --depth 2 --budget 0.05
+#   python bot.py --games 200 --workers 8
+
+import argparse
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from core import Board, Game, pieces, ROTATE_CW, ROTATE_CCW, LEFT, RIGHT, DROP_ALL, RESERVE
+
+# a game reduced to what the search needs, small enough to send to pool workers
+Position = namedtuple('Position', ['rows', 'cols', 'masks', 'stone', 'rotation', 'stone_x', 'stone_y', 'queue',
+                                   'reserved', 'can_reserve'])
+
+Plan = namedtuple('Plan', ['actions', 'value', 'reserve', 'rotation', 'x', 'depth'])
+
+# weights from the usual four feature tetris heuristic
+default_weights = {
+    'lines': 0.76,
+    'height': -0.51,
+    'holes': -0.36,
+    'bumpiness': -0.18,
+}
+
+lost = float('-inf')
+
+
+def position(game):
+    reserved = None
+    if game.reserved_stone:
+        reserved = (game.reserved_stone.index, game.reserved_stone.rotation)
+    queue = tuple(game.queue.peek(i).index for i in range(game.preview))
+    return Position(game.board.rows, game.board.cols, tuple(game.board.masks), game.stone.index, game.stone.rotation,
+                    game.stone_x, game.stone_y, queue, reserved, not game.reserved)
+
+
+class SearchBoard:
+    # just the bits of a Board, enough to borrow its collision and landing code
+    collides = Board.collides
+    landing_row = Board.landing_row
+
+    def __init__(self, rows, cols, masks):
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << cols) - 1
+        self.masks = masks
+        self.columns = [0] * cols
+        for y, mask in enumerate(masks):
+            x = 0
+            while mask:
+                if mask & 1:
+                    self.columns[x] |= 1 << y
+                mask >>= 1
+                x += 1
+
+
+def features(masks, rows, cols):
+    heights = [0] * cols
+    seen = 0
+    holes = 0
+    for y, mask in enumerate(masks):
+        if not seen and not mask:
+            continue
+        holes += bin(seen & ~mask).count('1')
+        new = mask & ~seen
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = rows - y
+            new ^= low
+        seen |= mask
+    bumpiness = 0
+    for x in range(cols - 1):
+        bumpiness += abs(heights[x] - heights[x + 1])
+    return {'height': sum(heights), 'max_height': max(heights), 'holes': holes, 'bumpiness': bumpiness}
+
+
+def linear_heuristic(weights):
+    def evaluate(masks, rows, cols):
+        values = features(masks, rows, cols)
+        return sum(weight * values[name] for name, weight in weights.items() if name in values)
+    return evaluate
+
+
+def place(board, stone, x, y):
+    # returns the masks after locking the stone and clearing full rows, and how many rows cleared
+    masks = list(board.masks)
+    for cy, mask in enumerate(stone.masks):
+        masks[y + cy] |= mask << x
+    keep = [mask for mask in masks if mask != board.full]
+    lines = board.rows - len(keep)
+    if lines:
+        keep = [0] * lines + keep
+    return tuple(keep), lines
+
+
+def placements(board, stone, x0, y0):
+    # yields (stone, x, landing y, actions) for every rotate-in-place, shift, hard drop path
+    if board.collides(stone.masks, x0, y0):
+        return
+    seen = set()
+    for turns, turn_action in ((0, None), (1, ROTATE_CW), (2, ROTATE_CW), (3, ROTATE_CCW)):
+        # turning three times clockwise is one counter clockwise turn
+        steps = turns if turns < 3 else 1
+        step = 1 if turns < 3 else 3
+        rotation = stone.rotation
+        ok = True
+        for i in range(steps):
+            rotation = (rotation + step) & 3
+            if board.collides(pieces[stone.index][rotation].masks, x0, y0):
+                ok = False
+                break
+        if not ok:
+            continue
+        rotated = pieces[stone.index][rotation]
+        rotate_actions = [turn_action] * steps
+        for direction, shift_action in ((0, None), (-1, LEFT), (1, RIGHT)):
+            x = x0
+            shifts = 0
+            while True:
+                if direction:
+                    new_x = min(max(x + direction, 0), rotated.max_x)
+                    if new_x == x or board.collides(rotated.masks, new_x, y0):
+                        break
+                    x = new_x
+                    shifts += 1
+                key = (rotated.masks, x)
+                if key not in seen:
+                    seen.add(key)
+                    yield rotated, x, board.landing_row(rotated, x, y0), rotate_actions + [shift_action] * shifts
+                if not direction:
+                    break
+
+
+class Bot:
+    def __init__(self, depth=2, budget=None, weights=None, evaluate=None, beam=6, cache_size=200000):
+        self.depth = depth
+        self.budget = budget  # seconds per plan, None = always search to depth
+        self.weights = dict(default_weights, **(weights or {}))
+        self.evaluate = evaluate or linear_heuristic({k: v for k, v in self.weights.items() if k != 'lines'})
+        self.beam = beam
+        self.cache_size = cache_size
+        self.evaluations = {}  # masks -> heuristic value
+        self.nodes = {}  # (masks, queue) -> best value below
+        self.hits = 0
+        self.misses = 0
+        self.deadline = None
+
+    def board_value(self, masks, rows, cols):
+        if masks in self.evaluations:
+            self.hits += 1
+            return self.evaluations[masks]
+        self.misses += 1
+        if len(self.evaluations) > self.cache_size:
+            self.evaluations.clear()
+        value = self.evaluate(masks, rows, cols)
+        self.evaluations[masks] = value
+        return value
+
+    def out_of_time(self):
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def children(self, pos, masks, stone, x, y):
+        board = SearchBoard(pos.rows, pos.cols, masks)
+        result = []
+        for rotated, px, py, actions in placements(board, stone, x, y):
+            child, lines = place(board, rotated, px, py)
+            value = self.weights['lines'] * lines + self.board_value(child, pos.rows, pos.cols)
+            result.append((value, child, lines, rotated, px, actions))
+        result.sort(key=lambda child: -child[0])
+        return result
+
+    def lookahead(self, pos, masks, queue):
+        # best value reachable from this board with the given preview pieces still to place
+        if not queue:
+            return self.board_value(masks, pos.rows, pos.cols)
+        key = (masks, queue)
+        if key in self.nodes:
+            self.hits += 1
+            return self.nodes[key]
+        stone = pieces[queue[0]][0]
+        options = self.children(pos, masks, stone, stone.spawn_x, 0)
+        if not options:
+            return lost
+        best = lost
+        for value, child, lines, rotated, px, actions in options[:self.beam]:
+            if self.out_of_time():
+                best = max(best, value)
+                break
+            best = max(best, self.weights['lines'] * lines + self.lookahead(pos, child, queue[1:]))
+        # out of time means this node, or one below it, was cut short: fine to use once, not to keep
+        if self.out_of_time():
+            return best
+        if len(self.nodes) > self.cache_size:
+            self.nodes.clear()
+        self.nodes[key] = best
+        return best
+
+    def roots(self, pos):
+        # (stone, x, y, preview queue, reserve) for playing the current stone, and for swapping it out
+        current = pieces[pos.stone][pos.rotation]
+        roots = [(current, pos.stone_x, pos.stone_y, pos.queue, False)]
+        if pos.can_reserve:
+            if pos.reserved:
+                stone = pieces[pos.reserved[0]][pos.reserved[1]]
+                roots.append((stone, stone.spawn_x, 0, pos.queue, True))
+            elif pos.queue:
+                stone = pieces[pos.queue[0]][0]
+                roots.append((stone, stone.spawn_x, 0, pos.queue[1:], True))
+        return roots
+
+    def search(self, pos, depth):
+        best = None
+        for stone, x, y, queue, reserve in self.roots(pos):
+            for value, child, lines, rotated, px, actions in self.children(pos, pos.masks, stone, x, y):
+                if depth > 1:
+                    value = self.weights['lines'] * lines + self.lookahead(pos, child, queue[:depth - 1])
+                if best is None or value > best.value:
+                    prefix = [RESERVE] if reserve else []
+                    best = Plan(prefix + [a for a in actions if a] + [DROP_ALL], value, reserve, rotated.rotation,
+                                px, depth)
+                if self.out_of_time():
+                    return best
+        return best
+
+    def plan(self, pos):
+        if isinstance(pos, Game):
+            pos = position(pos)
+        self.deadline = None
+        if self.budget is not None:
+            self.deadline = time.perf_counter() + self.budget
+        best = None
+        for depth in range(1, self.depth + 1):
+            result = self.search(pos, depth)
+            if result is not None and (best is None or not self.out_of_time()):
+                best = result
+            if self.out_of_time():
+                break
+        return best
+
+    def play(self, game):
+        # plans for the current stone and applies the whole plan, returns False if there was nothing to do
+        plan = self.plan(game)
+        if plan is None:
+            return False
+        for action in plan.actions:
+            game.step(action)
+        return True
+
+
+worker_bot = None
+
+
+def pool_plan(args):
+    # one Bot per worker process, so its caches carry over between positions
+    global worker_bot
+    pos, settings = args
+    if worker_bot is None or worker_bot.settings != settings:
+        worker_bot = Bot(**settings)
+        worker_bot.settings = settings
+    return worker_bot.plan(pos)
+
+
+def plan_many(positions, workers=None, **settings):
+    # plans every position on a process pool, results come back in order
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(pool_plan, [(pos, settings) for pos in positions], chunksize=8))
+
+
+def play_game(seed, max_pieces=500, **settings):
+    bot = Bot(**settings)
+    game = Game(seed)
+    count = 0
+    while not game.over and count < max_pieces:
+        if not bot.play(game):
+            break
+        count += 1
+    return {'seed': seed, 'pieces': count, 'lines': game.lines, 'score': game.score, 'over': game.over}
+
+
+def pool_game(args):
+    seed, max_pieces, settings = args
+    return play_game(seed, max_pieces, **settings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='play headless games with the placement search bot')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--budget', type=float, default=None, help='seconds per placement')
+    parser.add_argument('--beam', type=int, default=6)
+    parser.add_argument('--max-pieces', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1, help='>1 plays the games on a process pool')
+    args = parser.parse_args()
+
+    settings = {'depth': args.depth, 'budget': args.budget, 'beam': args.beam}
+    jobs = [(args.seed + i, args.max_pieces, settings) for i in range(args.games)]
+    start = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers) as pool:
+            results = list(pool.map(pool_game, jobs))
+    else:
+        results = [pool_game(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+    for result in results:
+        print('seed=%(seed)d pieces=%(pieces)d lines=%(lines)d score=%(score)d over=%(over)s' % result)
+    pieces_placed = sum(result['pieces'] for result in results)
+    print('%d games, %d pieces, %.0f pieces/s' % (len(results), pieces_placed, pieces_placed / elapsed))
+
+
+if __name__ == "__main__":
+    main()
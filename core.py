@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+
+# game logic only - no pygame, so it can be imported and stepped without a display
+
+import random
+from collections import namedtuple
+
+config = {
+    'rows': 20,  # change with set_geometry, the piece table depends on cols
+    'cols': 10,
+    'delay': 1000,
+    'sim_hz': 120,  # fixed simulation steps per second
+    'garbage_target': 'even',  # who gets a player's garbage rows, one of garbage_targets
+    'randomizer': 'bag',  # how the next pieces are picked, one of randomizers
+    'preview': 2,  # upcoming pieces shown, 1 to max_preview
+}
+
+colors = [
+    (0, 0, 0),
+    (255, 0, 0),
+    (0, 150, 0),
+    (0, 0, 255),
+    (255, 120, 0),
+    (255, 255, 0),
+    (180, 0, 255),
+    (0, 220, 220)
+]
+
+shapes = [
+    [[1, 1, 0],
+     [0, 1, 1]],
+
+    [[0, 2, 2],
+     [2, 2, 0]],
+
+    [[3, 3, 3],
+     [0, 3, 0]],
+
+    [[4, 4, 4],
+     [4, 0, 0]],
+
+    [[5, 5, 5],
+     [0, 0, 5]],
+
+    [[6, 6],
+     [6, 6]],
+
+    [[7, 7, 7, 7]]
+]
+
+# actions accepted by Game.step
+NOOP = 0
+LEFT = 1
+RIGHT = 2
+DOWN = 3
+DROP_ALL = 4
+ROTATE_CW = 5
+ROTATE_CCW = 6
+RESERVE = 7
+
+actions = ['noop', 'left', 'right', 'down', 'drop_all', 'rotate_cw', 'rotate_ccw', 'reserve']
+
+max_rows = 100
+max_cols = 100
+
+# bag = every shape once per bag of 7 in random order, history = up to 4 rolls in all, rerolling a shape that
+# was one of the last 4, random = every shape equally likely every time
+randomizers = ['bag', 'history', 'random']
+max_preview = 6
+
+# even = one row at a time round the other players, random = a random opponent per row, leader = the top score
+garbage_targets = ['even', 'random', 'leader']
+
+# one entry per (shape, rotation), built once by build_pieces
+# bottoms holds (column, lowest row) for each column of the shape
+Piece = namedtuple('Piece', ['index', 'rotation', 'shape', 'masks', 'cells', 'bottoms', 'width', 'height', 'spawn_x',
+                             'max_x'])
+
+State = namedtuple('State', ['board', 'stone', 'stone_x', 'stone_y', 'first_stone', 'second_stone',
+                             'reserved_stone', 'lines', 'score', 'over'])
+
+# per column heights and holes of a board and the tallest column
+Stack = namedtuple('Stack', ['heights', 'holes', 'max_height'])
+
+
+class Board:
+    # each row is an int bitmask (bit x set = cell x occupied), cells keeps the colors for drawing
+    # columns holds the same bits transposed (bit y of columns[x] set = cell x, y occupied)
+    # heights, holes and max_height summarize the stack, kept up to date from the columns that change
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << cols) - 1
+        self.masks = [0] * rows
+        self.columns = [0] * cols
+        self.cells = [[0] * cols for y in range(rows)]
+        self.heights = [0] * cols
+        self.holes = [0] * cols  # empty cells under the top of each column
+        self.max_height = 0
+        self.dirty = (1 << rows) - 1  # bit y set = row y changed, cleared by whoever sends the rows on
+
+    def collides(self, masks, off_x, off_y):
+        if off_x < 0:
+            return True
+        for cy, mask in enumerate(masks):
+            if mask:
+                y = off_y + cy
+                shifted = mask << off_x
+                if y < 0 or y >= self.rows or shifted & ~self.full or self.masks[y] & shifted:
+                    return True
+        return False
+
+    def merge(self, cells, masks, off_x, off_y):
+        for cy, mask in enumerate(masks):
+            self.masks[off_y + cy] |= mask << off_x
+        self.dirty |= ((1 << len(masks)) - 1) << off_y
+        heights = self.heights
+        for cx, cy, val in cells:
+            x = off_x + cx
+            y = off_y + cy
+            self.cells[y][x] = val
+            column = self.columns[x]
+            if column >> y & 1:
+                continue  # garbage can push the stack into a falling stone
+            self.columns[x] = column | 1 << y
+            # a cell above the column top raises it (leaving holes in any gap), one below fills a hole
+            height = self.rows - y
+            if height > heights[x]:
+                self.holes[x] += height - heights[x] - 1
+                heights[x] = height
+                if height > self.max_height:
+                    self.max_height = height
+            else:
+                self.holes[x] -= 1
+
+    def clear_lines(self):
+        full = self.full
+        if full not in self.masks:
+            return 0
+        cleared = [y for y, mask in enumerate(self.masks) if mask == full]
+        keep = [y for y, mask in enumerate(self.masks) if mask != full]
+        count = len(cleared)
+        self.masks = [0] * count + [self.masks[y] for y in keep]
+        self.cells = [[0] * self.cols for i in range(count)] + [self.cells[y] for y in keep]
+        self.dirty |= (1 << (cleared[-1] + 1)) - 1
+        # drop the cleared bits out of every column, the bits above each one move down a row
+        for x in range(self.cols):
+            column = self.columns[x]
+            for y in cleared:
+                column = column >> (y + 1) << (y + 1) | (column & ((1 << y) - 1)) << 1
+            self.columns[x] = column
+            self.update_column(x)
+        self.max_height = max(self.heights)
+        return count
+
+    def update_column(self, x):
+        column = self.columns[x]
+        if column:
+            height = self.rows - (column & -column).bit_length() + 1
+            self.heights[x] = height
+            self.holes[x] = height - bin(column).count('1')
+        else:
+            self.heights[x] = 0
+            self.holes[x] = 0
+
+    def update_columns(self):
+        columns = [0] * self.cols
+        for y, mask in enumerate(self.masks):
+            x = 0
+            while mask:
+                if mask & 1:
+                    columns[x] |= 1 << y
+                mask >>= 1
+                x += 1
+        self.columns = columns
+        for x in range(self.cols):
+            self.update_column(x)
+        self.max_height = max(self.heights)
+        self.dirty = (1 << self.rows) - 1
+
+    def save(self):
+        return list(self.masks), [list(row) for row in self.cells], list(self.columns)
+
+    def load(self, state):
+        masks, cells, columns = state
+        self.masks = list(masks)
+        self.cells = [list(row) for row in cells]
+        self.columns = list(columns)
+        for x in range(self.cols):
+            self.update_column(x)
+        self.max_height = max(self.heights)
+        self.dirty = (1 << self.rows) - 1
+
+    def push_lines(self, masks, cells):
+        # pushes the whole stack up by len(masks) rows in one go, the new rows come in at the bottom
+        count = len(masks)
+        self.masks = self.masks[count:] + masks
+        self.cells = self.cells[count:] + cells
+        self.dirty = (1 << self.rows) - 1
+        first = self.rows - count
+        for x in range(self.cols):
+            column = self.columns[x] >> count
+            for i, mask in enumerate(masks):
+                if mask >> x & 1:
+                    column |= 1 << (first + i)
+            self.columns[x] = column
+            self.update_column(x)
+        self.max_height = max(self.heights)
+
+    def landing_row(self, stone, off_x, off_y):
+        # lowest y the stone falls to from off_y: the first filled cell under each of its columns stops it
+        land = self.rows
+        for cx, bottom in stone.bottoms:
+            below = self.columns[off_x + cx] >> (off_y + bottom + 1)
+            if below:
+                hit = off_y + bottom + (below & -below).bit_length()
+            else:
+                hit = self.rows
+            if hit - 1 - bottom < land:
+                land = hit - 1 - bottom
+        return land
+
+
+def new_board():
+    return Board(config['rows'], config['cols'])
+
+
+class PieceQueue:
+    # upcoming piece indexes, made a block at a time from the queue's own rng. the previews are read
+    # straight out of the block, and there are always at least max_preview of them.
+    block = 56  # 8 bags
+
+    def __init__(self, seed=None, randomizer=None):
+        self.rng = random.Random(seed)
+        self.randomizer = randomizer or config['randomizer']
+        if self.randomizer not in randomizers:
+            raise ValueError("unknown randomizer %r" % self.randomizer)
+        self.history = []
+        self.indexes = []
+        self.pos = 0
+        self.refill()
+
+    def refill(self):
+        count = len(shapes)
+        rng = self.rng
+        if self.randomizer == 'bag':
+            block = []
+            for i in range(self.block // count):
+                bag = list(range(count))
+                rng.shuffle(bag)
+                block += bag
+        elif self.randomizer == 'history':
+            block = []
+            history = self.history
+            for i in range(self.block):
+                for roll in range(4):
+                    index = rng.randrange(count)
+                    if index not in history:
+                        break
+                history.append(index)
+                if len(history) > 4:
+                    del history[0]
+                block.append(index)
+        else:
+            block = [rng.randrange(count) for i in range(self.block)]
+        # a new list rather than in place, so a saved queue can keep the old one
+        self.indexes = self.indexes[self.pos:] + block
+        self.pos = 0
+
+    def next(self):
+        index = self.indexes[self.pos]
+        self.pos += 1
+        if len(self.indexes) - self.pos < max_preview:
+            self.refill()
+        return pieces[index][0]
+
+    def peek(self, i):
+        # i = 0 is the next stone
+        return pieces[self.indexes[self.pos + i]][0]
+
+    def upcoming(self):
+        return self.indexes[self.pos:]
+
+    def save(self):
+        return self.indexes, self.pos, self.rng.getstate(), tuple(self.history)
+
+    def load(self, state):
+        self.indexes, self.pos, rng, history = state
+        self.rng.setstate(rng)
+        self.history = list(history)
+
+
+def rotate_clockwise(shape):
+    new_shape = []
+    for x in range(len(shape[0])):
+        new_row = []
+        for y in range(len(shape) - 1, -1, -1):
+            new_row.append(shape[y][x])
+        new_shape.append(new_row)
+    return new_shape
+
+
+def shape_masks(shape):
+    masks = []
+    for row in shape:
+        mask = 0
+        for cx, val in enumerate(row):
+            if val:
+                mask |= 1 << cx
+        masks.append(mask)
+    return masks
+
+
+def check_collision(board, masks, off_x, off_y):
+    return board.collides(masks, off_x, off_y)
+
+
+def build_pieces(cols):
+    table = []
+    for index, shape in enumerate(shapes):
+        rotations = []
+        for rotation in range(4):
+            width = len(shape[0])
+            cells = tuple((cx, cy, val) for cy, row in enumerate(shape) for cx, val in enumerate(row) if val)
+            bottoms = tuple((cx, max(cy for x, cy, val in cells if x == cx)) for cx in range(width))
+            rotations.append(Piece(index, rotation, tuple(tuple(row) for row in shape), tuple(shape_masks(shape)),
+                                   cells, bottoms, width, len(shape), (cols - width) // 2, cols - width))
+            shape = rotate_clockwise(shape)
+        table.append(tuple(rotations))
+    return tuple(table)
+
+
+# a list so set_geometry can refill it in place for everything that imported it
+pieces = list(build_pieces(config['cols']))
+
+
+def set_geometry(rows, cols):
+    # takes effect for boards made after this call
+    if not 4 <= rows <= max_rows or not 4 <= cols <= max_cols:
+        raise ValueError("board size must be between 4x4 and %dx%d" % (max_cols, max_rows))
+    config['rows'] = rows
+    config['cols'] = cols
+    pieces[:] = build_pieces(cols)
+
+
+def gravity_delay(lines, delay=None):
+    threshold = [10, 20, 30, 40, 50, 60, 70, 80, 90]
+    if delay is None:
+        delay = config['delay']
+    for i in range(len(threshold)):
+        if lines > threshold[i]:
+            delay -= 95
+    return delay
+
+
+class GarbageRouter:
+    # each player's attack (rand_line_counter) first cancels rows queued against them, the rest is queued on
+    # the targets, then every queue is added to its board in one push. with two players this is the old
+    # rand_lines: the difference of the two attacks goes to whoever sent less.
+    def __init__(self, seed=None, target=None):
+        self.rng = random.Random(seed)
+        self.target = target or config['garbage_target']
+        self.next_target = 0
+
+    def route(self, players):
+        attackers = [i for i, player in enumerate(players) if player.rand_line_counter]
+        if attackers and len(players) > 1:
+            leaders = None
+            if self.target == 'leader':
+                leaders = sorted(range(len(players)), key=lambda i: -players[i].score)[:2]
+            for i in attackers:
+                player = players[i]
+                count = player.rand_line_counter
+                cancel = min(count, player.garbage_queue)
+                player.garbage_queue -= cancel
+                count -= cancel
+                if count:
+                    self.send(players, i, count, leaders)
+        for i in attackers:
+            players[i].rand_line_counter = 0
+        for i, player in enumerate(players):
+            if player.garbage_queue:
+                player.add_rand_lines(player.garbage_queue)
+                player.garbage_queue = 0
+
+    def send(self, players, attacker, count, leaders):
+        others = len(players) - 1
+        if self.target == 'leader':
+            if leaders[0] != attacker:
+                players[leaders[0]].garbage_queue += count
+            else:
+                players[leaders[1]].garbage_queue += count
+        elif self.target == 'random':
+            for n in range(count):
+                target = self.rng.randrange(others)
+                if target >= attacker:
+                    target += 1
+                players[target].garbage_queue += 1
+        else:
+            for n in range(count):
+                target = self.next_target % others
+                self.next_target += 1
+                if target >= attacker:
+                    target += 1
+                players[target].garbage_queue += 1
+
+    def save(self):
+        return self.rng.getstate(), self.next_target
+
+    def load(self, state):
+        rng, self.next_target = state
+        self.rng.setstate(rng)
+
+
+def gravity_tick(players, router):
+    router.route(players)
+    for i, player in enumerate(players):
+        player.drop()
+
+
+def player_seed(seed, id_num):
+    # every player of a seeded match gets its own stream
+    return seed << 8 | id_num
+
+
+class Gravity:
+    # drops every player once per gravity_delay ms of fixed sim steps
+    def __init__(self, sim_hz, base_delay=None, router=None):
+        self.step_ms = 1000.0 / sim_hz
+        self.base_delay = base_delay or config['delay']
+        self.router = router or GarbageRouter()
+        self.elapsed = 0.0
+        self.delay = gravity_delay(0, self.base_delay)
+        self.ticks = 0
+
+    def step(self, players):
+        self.ticks += 1
+        self.elapsed += self.step_ms
+        if self.elapsed >= self.delay:
+            self.elapsed -= self.delay
+            gravity_tick(players, self.router)
+            self.delay = gravity_delay(sum(player.lines for player in players), self.base_delay)
+
+
+class Game:
+    def __init__(self, seed=None, match=None, randomizer=None):
+        self.rng = random.Random(seed)
+        self.match = match
+        self.over = False
+
+        self.stone = None
+        self.stone_masks = None
+        # pieces come from their own stream, seeded off this player's, so garbage doesn't change them
+        self.queue = PieceQueue(self.rng.getrandbits(64), randomizer)
+        self.preview = min(max(config['preview'], 1), max_preview)
+        self.reserved_stone = None
+        self.reserved = False
+
+        self.board = new_board()
+        self.stone_x = 0
+        self.stone_y = 0
+        self.new_stone()
+
+        self.lines = 0
+        self.score = 0
+        self.pieces = 0  # stones locked so far
+
+        self.rand_line_counter = 0
+        self.garbage_queue = 0  # rows sent to this player, added on the next gravity tick
+        self.garbage = 0  # garbage rows received so far
+
+        self.step_actions = [
+            None,
+            lambda: self.move(-1),
+            lambda: self.move(+1),
+            self.drop,
+            self.drop_all,
+            self.rotate_stone_cw,
+            self.rotate_stone_ccw,
+            self.reserve_stone
+        ]
+
+    def save(self):
+        # everything step() depends on, for rollback
+        return (self.board.save(), self.stone, self.stone_x, self.stone_y, self.queue.save(),
+                self.reserved_stone, self.reserved, self.lines, self.score, self.rand_line_counter,
+                self.garbage_queue, self.garbage, self.pieces, self.over, self.rng.getstate())
+
+    def load(self, state):
+        (board, stone, self.stone_x, self.stone_y, queue, self.reserved_stone,
+         self.reserved, self.lines, self.score, self.rand_line_counter, self.garbage_queue, self.garbage, self.pieces,
+         self.over, rng) = state
+        self.board.load(board)
+        self.queue.load(queue)
+        self.set_stone(stone)
+        self.rng.setstate(rng)
+
+    def playing(self):
+        if self.match:
+            return not self.match.over
+        return not self.over
+
+    def step(self, action):
+        if action:
+            self.step_actions[action]()
+        return self.state()
+
+    @property
+    def stack(self):
+        board = self.board
+        return Stack(tuple(board.heights), tuple(board.holes), board.max_height)
+
+    @property
+    def first_stone(self):
+        return self.queue.peek(0)
+
+    @property
+    def second_stone(self):
+        return self.queue.peek(1)
+
+    def state(self):
+        return State(self.board, self.stone, self.stone_x, self.stone_y, self.first_stone, self.second_stone,
+                     self.reserved_stone, self.lines, self.score, self.over)
+
+    def set_stone(self, stone):
+        self.stone = stone
+        self.stone_masks = stone.masks
+
+    def rotate_stone(self, turns):
+        new_stone = pieces[self.stone.index][(self.stone.rotation + turns) & 3]
+        if not check_collision(self.board, new_stone.masks, self.stone_x, self.stone_y):
+            self.set_stone(new_stone)
+
+    def rotate_stone_cw(self):
+        self.rotate_stone(1)
+
+    def rotate_stone_ccw(self):
+        self.rotate_stone(3)
+
+    def reserve_stone(self):
+        if not self.reserved:
+            if self.reserved_stone:
+                temp = self.reserved_stone
+                self.reserved_stone = self.stone
+                self.set_stone(temp)
+            else:
+                self.reserved_stone = self.stone
+                self.new_stone()
+            self.stone_x = self.stone.spawn_x
+            self.stone_y = 0
+            self.reserved = True
+
+    def new_stone(self):
+        self.set_stone(self.queue.next())
+
+        self.stone_x = self.stone.spawn_x
+        self.stone_y = 0
+
+        # a stack lower than rows - stone height can't reach the spawn position
+        if self.board.max_height > self.board.rows - self.stone.height and \
+                check_collision(self.board, self.stone_masks, self.stone_x, self.stone_y):
+            self.game_over()
+
+    def game_over(self):
+        self.over = True
+        if self.match:
+            self.match.over = True
+
+    def merge(self):
+        self.board.merge(self.stone.cells, self.stone_masks, self.stone_x, self.stone_y)
+        self.pieces += 1
+
+    def add_rand_lines(self, count):
+        count = min(count, self.board.rows)
+        masks = []
+        rows = []
+        for i in range(count):
+            new_row = []
+            empty_spot = self.rng.randrange(self.board.cols)
+            for x in range(self.board.cols):
+                if x == empty_spot:
+                    new_row.append(0)
+                else:
+                    new_row.append(self.rng.randrange(1, len(colors)))
+            masks.append(self.board.full & ~(1 << empty_spot))
+            rows.append(new_row)
+        self.board.push_lines(masks, rows)
+        self.garbage += count
+
+    def remove_lines(self):
+        count = self.board.clear_lines()
+        if count > 0:
+            # each extra line in one drop is worth 10 more than the previous one
+            self.score += 10 * count + 5 * count * (count - 1)
+            self.lines += count
+            self.rand_line_counter = count - 1
+
+    def drop(self):
+        if self.playing():
+            if check_collision(self.board, self.stone_masks, self.stone_x, self.stone_y + 1):
+                self.merge()
+                self.new_stone()
+                self.remove_lines()
+                self.reserved = False
+            else:
+                self.stone_y += 1
+
+    def ghost_y(self):
+        # garbage can push the stack up into the stone, landing_row would then find a row under the stack.
+        # a stuck stone stays where it is, like drop() leaves it
+        if self.board.max_height > self.board.rows - self.stone_y - self.stone.height and \
+                check_collision(self.board, self.stone_masks, self.stone_x, self.stone_y):
+            return self.stone_y
+        return self.board.landing_row(self.stone, self.stone_x, self.stone_y)
+
+    def drop_all(self):
+        if self.playing():
+            self.stone_y = self.ghost_y()
+            self.merge()
+            self.new_stone()
+            self.remove_lines()
+            self.reserved = False
+
+    def move(self, direction):
+        new_x = self.stone_x + direction
+        if new_x < 0:
+            new_x = 0
+        if new_x > self.stone.max_x:
+            new_x = self.stone.max_x
+        if not check_collision(self.board, self.stone_masks, new_x, self.stone_y):
+            self.stone_x = new_x
+
+
+class Match:
+    # headless version of a game in run(): players share gravity and garbage, and the match ends when one tops out
+    def __init__(self, num_players=1, seed=0, sim_hz=None, base_delay=None, garbage_target=None, randomizer=None):
+        self.seed = seed
+        self.over = False
+        self.randomizer = randomizer or config['randomizer']
+        self.gravity = Gravity(sim_hz or config['sim_hz'], base_delay, GarbageRouter(seed, garbage_target))
+        self.players = [Game(player_seed(seed, i), self, self.randomizer) for i in range(num_players)]
+
+    def step(self, inputs=()):
+        # inputs are (player, action) pairs, applied before this tick's gravity
+        for player, action in inputs:
+            self.players[player].step(action)
+        self.gravity.step(self.players)
+
+    def save(self):
+        gravity = self.gravity
+        return (gravity.elapsed, gravity.delay, gravity.ticks, gravity.router.save(), self.over,
+                [player.save() for player in self.players])
+
+    def load(self, state):
+        gravity = self.gravity
+        gravity.elapsed, gravity.delay, gravity.ticks, router, self.over, players = state
+        gravity.router.load(router)
+        for player, player_state in zip(self.players, players):
+            player.load(player_state)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# reinforcement learning environments (needs numpy)
+# TetrisEnv plays one core.Game, the rules Player runs on minus pygame, through reset()/step(action) with the
+# usual action codes, and writes its observation into numpy arrays it's given instead of returning new ones.
+# VectorEnv lays the arrays for n envs out in one shared memory block and steps the envs on worker processes
+# that fill it in place: actions go in through shared memory too, the pipes only carry a one byte signal.
+# finished envs start a new game on their own, the step that ended one still reports done.
+#   python env.py --envs 64 --workers 4 --steps 200000
+
+import argparse
+import multiprocessing
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core import config, Game, set_geometry, max_preview
+
+env_config = {
+    'drop_every': 4,  # steps between gravity drops, 0 = the stone only falls when the agent moves it down
+}
+
+num_actions = 8  # core.NOOP to core.RESERVE
+no_stone = -1
+
+
+def layout(n, rows, cols, preview):
+    # name, dtype, shape of every array in the shared block, in order
+    return [
+        ('board', np.uint8, (n, rows, cols)),  # colors, 0 = empty
+        ('stone', np.int16, (n, 4)),  # piece, rotation, x, y
+        ('queue', np.int8, (n, preview)),  # upcoming pieces
+        ('reserve', np.int8, (n, 2)),  # reserved piece (no_stone = none), whether reserving is allowed
+        ('counters', np.int32, (n, 3)),  # lines, score, pieces
+        ('reward', np.float32, (n,)),
+        ('done', np.bool_, (n,)),
+        ('action', np.uint8, (n,)),
+    ]
+
+
+def block_size(n, rows, cols, preview):
+    size = 0
+    for name, dtype, shape in layout(n, rows, cols, preview):
+        size += -size % 8 + np.dtype(dtype).itemsize * int(np.prod(shape))
+    return size
+
+
+def map_arrays(buf, n, rows, cols, preview):
+    # numpy views over buf, each array starting on an 8 byte boundary
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in layout(n, rows, cols, preview):
+        offset += -offset % 8
+        arrays[name] = np.ndarray(shape, dtype, buf, offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+
+class TetrisEnv:
+    def __init__(self, seed=None, randomizer=None, arrays=None, index=0):
+        self.rng = random.Random(seed)
+        self.randomizer = randomizer
+        self.preview = min(max(config['preview'], 1), max_preview)
+        if arrays is None:
+            arrays = map_arrays(bytearray(block_size(1, config['rows'], config['cols'], self.preview)), 1,
+                                config['rows'], config['cols'], self.preview)
+        self.arrays = arrays
+        self.index = index
+        self.board = arrays['board'][index]
+        self.stone = arrays['stone'][index]
+        self.queue = arrays['queue'][index]
+        self.reserve = arrays['reserve'][index]
+        self.counters = arrays['counters'][index]
+        self.game = None
+        self.steps = 0
+
+    def reset(self, seed=None):
+        self.new_game(seed)
+        self.arrays['reward'][self.index] = 0
+        self.arrays['done'][self.index] = False
+        return self.arrays
+
+    def new_game(self, seed=None):
+        # reset() without touching reward and done, so an auto reset still shows how the last game ended
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+        self.game = Game(seed, randomizer=self.randomizer)
+        self.steps = 0
+        self.observe()
+
+    def step(self, action):
+        game = self.game
+        score = game.score
+        game.step(action)
+        self.steps += 1
+        if env_config['drop_every'] and self.steps % env_config['drop_every'] == 0:
+            game.drop()
+        self.observe()
+        reward = game.score - score
+        self.arrays['reward'][self.index] = reward
+        self.arrays['done'][self.index] = game.over
+        return self.arrays, reward, game.over
+
+    def observe(self):
+        game = self.game
+        board = game.board
+        # only the rows that changed since the last observation are copied
+        dirty = board.dirty
+        board.dirty = 0
+        y = 0
+        while dirty:
+            if dirty & 1:
+                self.board[y] = board.cells[y]
+            dirty >>= 1
+            y += 1
+        stone = game.stone
+        self.stone[:] = (stone.index, stone.rotation, game.stone_x, game.stone_y)
+        queue = game.queue
+        self.queue[:] = queue.indexes[queue.pos:queue.pos + self.preview]
+        reserved = game.reserved_stone
+        self.reserve[:] = (reserved.index if reserved else no_stone, not game.reserved)
+        self.counters[:] = (game.lines, game.score, game.pieces)
+
+
+def env_seeds(seed, n):
+    # one independent seed per env. core.player_seed only has room for 256 players, past that envs would share
+    # a seed and play the same games forever
+    return [int(child.generate_state(1, np.uint64)[0]) for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+def worker(name, conn, start, end, settings):
+    n, rows, cols, preview, seed, randomizer, drop_every = settings
+    set_geometry(rows, cols)
+    config['preview'] = preview
+    env_config['drop_every'] = drop_every
+    shm = shared_memory.SharedMemory(name)
+    arrays = map_arrays(shm.buf, n, rows, cols, preview)
+    seeds = env_seeds(seed, n)
+    envs = [TetrisEnv(seeds[i], randomizer, arrays, i) for i in range(start, end)]
+    actions = arrays['action']
+    try:
+        while True:
+            command = conn.recv_bytes()
+            if command == b'q':
+                break
+            if command == b'r':
+                for env in envs:
+                    env.reset()
+            else:
+                todo = actions[start:end].tolist()
+                for env, action in zip(envs, todo):
+                    if env.step(action)[2]:
+                        env.new_game()
+            conn.send_bytes(b'd')
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del arrays, actions, envs
+        shm.close()
+
+
+class VectorEnv:
+    def __init__(self, n, workers=None, seed=0, randomizer=None):
+        self.n = n
+        self.rows = config['rows']
+        self.cols = config['cols']
+        self.preview = min(max(config['preview'], 1), max_preview)
+        self.shm = shared_memory.SharedMemory(create=True, size=block_size(n, self.rows, self.cols, self.preview))
+        self.arrays = map_arrays(self.shm.buf, n, self.rows, self.cols, self.preview)
+        workers = min(workers or multiprocessing.cpu_count(), n)
+        settings = (n, self.rows, self.cols, self.preview, seed, randomizer, env_config['drop_every'])
+        self.conns = []
+        self.procs = []
+        for w in range(workers):
+            parent, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=worker, args=(self.shm.name, child, n * w // workers,
+                                                                n * (w + 1) // workers, settings), daemon=True)
+            proc.start()
+            self.conns.append(parent)
+            self.procs.append(proc)
+
+    def signal(self, command):
+        for conn in self.conns:
+            conn.send_bytes(command)
+        for conn in self.conns:
+            conn.recv_bytes()
+
+    def reset(self):
+        self.signal(b'r')
+        return self.arrays
+
+    def step(self, actions):
+        # the arrays returned are the shared ones, the next step overwrites them
+        self.arrays['action'][:] = actions
+        self.signal(b's')
+        return self.arrays, self.arrays['reward'], self.arrays['done']
+
+    def close(self):
+        for conn in self.conns:
+            conn.send_bytes(b'q')
+        for proc in self.procs:
+            proc.join()
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='step vectorized environments with random actions')
+    parser.add_argument('--envs', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--steps', type=int, default=100000, help='transitions in total')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs, args.workers, args.seed)
+    rng = np.random.default_rng(args.seed)
+    env.reset()
+    games = 0
+    start = time.perf_counter()
+    for i in range(args.steps // args.envs):
+        obs, reward, done = env.step(rng.integers(1, num_actions, args.envs))
+        games += int(done.sum())
+    elapsed = time.perf_counter() - start
+    steps = args.steps // args.envs * args.envs
+    print('%d envs on %d workers: %d transitions in %.1fs, %.0f/s (%.1fM/hour), %d games finished' % (
+        args.envs, len(env.procs), steps, elapsed, steps / elapsed, steps / elapsed * 3600 / 1e6, games))
+    env.close()
+
+
+if __name__ == "__main__":
+    main()
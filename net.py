@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+# authoritative asyncio server and client for N player matches
+# clients only send inputs, stamped with the tick they should apply on. the server runs every room's core.Match
+# at sim_hz; an input for a tick already simulated rolls the room back to a snapshot and replays it (up to
+# rollback_window ticks, anything later is applied on the current tick). every send_every ticks each room
+# encodes one binary delta (changed rows only, keyframes now and then) and writes the same bytes to all
+# its players.
+#   python net.py serve --port 7777
+#   python net.py loopback --matches 200 --players 4 --seconds 10
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+
+from core import config, pieces, Board, Match
+
+net_config = {
+    'sim_hz': 60,
+    'send_every': 2,  # ticks between state messages
+    'keyframe_every': 60,  # state messages between keyframes
+    'rollback_window': 30,  # ticks an input may arrive late and still be applied on its own tick
+    'snapshot_every': 8,  # ticks between rollback snapshots
+    'input_delay': 3,  # ticks clients stamp ahead of the last tick they saw
+}
+
+# message types
+JOIN = 1
+INPUT = 2
+START = 3
+STATE = 4
+END = 5
+
+frame = struct.Struct('<I')  # payload length
+join_msg = struct.Struct('<BB')  # type, players wanted (room name follows)
+input_msg = struct.Struct('<BIB')  # type, tick, action
+start_msg = struct.Struct('<BBBHHQBB')  # type, your id, players, sim_hz, base delay, seed, rows, cols
+state_head = struct.Struct('<BIBB')  # type, tick, keyframe, players in message
+# id, piece, rotation, x, y, first, second, reserved, lines, score, garbage, over | rows that follow << 1
+# then the reserved stone's rotation (if any) and each changed row as its y plus two cells per byte
+player_head = struct.Struct('<BBBbBBBBHIHB')
+end_msg = struct.Struct('<BI')  # type, tick
+
+no_stone = 255
+
+
+def pack_row(row):
+    # two cells per byte
+    out = bytearray((len(row) + 1) // 2)
+    for x, val in enumerate(row):
+        out[x >> 1] |= val << ((x & 1) * 4)
+    return out
+
+
+def unpack_row(data, pos, cols):
+    return [data[pos + (x >> 1)] >> ((x & 1) * 4) & 15 for x in range(cols)]
+
+
+def stone_id(stone):
+    if stone is None:
+        return no_stone
+    return stone.index
+
+
+class StateEncoder:
+    # one stream for everyone watching these players: a player only goes out when its stone or counters
+    # changed, and only with the rows its board marked dirty (the encoder clears them)
+    def __init__(self, num_players):
+        self.sent = [None] * num_players  # player_head fields last sent
+        self.messages = 0
+
+    def encode(self, tick, players, keyframe=False):
+        keyframe = keyframe or self.messages % net_config['keyframe_every'] == 0
+        self.messages += 1
+        out = bytearray(state_head.pack(STATE, tick, keyframe, 0))
+        count = 0
+        for i, player in enumerate(players):
+            board = player.board
+            dirty = board.dirty
+            board.dirty = 0
+            if keyframe:
+                rows = range(board.rows)
+            elif dirty:
+                rows = [y for y in range(board.rows) if dirty >> y & 1]
+            else:
+                rows = ()
+            reserved = player.reserved_stone
+            head = (player.stone.index, player.stone.rotation, player.stone_x, player.stone_y,
+                    player.first_stone.index, player.second_stone.index, stone_id(reserved), player.lines,
+                    player.score, player.garbage, player.over, reserved.rotation if reserved else 0)
+            if not keyframe and not rows and head == self.sent[i]:
+                continue
+            self.sent[i] = head
+            count += 1
+            out += player_head.pack(i, *head[:10], len(rows) << 1 | player.over)
+            if reserved is not None:
+                out.append(reserved.rotation)
+            cells = board.cells
+            for y in rows:
+                out.append(y)
+                out += pack_row(cells[y])
+        out[state_head.size - 1] = count
+        return bytes(out)
+
+
+class RemotePlayer:
+    # client side mirror with the same attributes the renderer reads from a Game
+    def __init__(self, rows, cols):
+        self.board = Board(rows, cols)
+        self.stone = pieces[0][0]
+        self.stone_x = 0
+        self.stone_y = 0
+        self.first_stone = pieces[0][0]
+        self.second_stone = pieces[0][0]
+        self.reserved_stone = None
+        self.lines = 0
+        self.score = 0
+        self.garbage = 0
+        self.over = False
+
+
+def decode_state(data, players, cols):
+    kind, tick, keyframe, count = state_head.unpack_from(data)
+    pos = state_head.size
+    row_bytes = (cols + 1) // 2
+    for n in range(count):
+        (i, piece, rotation, x, y, first, second, reserved, lines, score, garbage,
+         flags) = player_head.unpack_from(data, pos)
+        pos += player_head.size
+        player = players[i]
+        player.stone = pieces[piece][rotation]
+        player.stone_x = x
+        player.stone_y = y
+        player.first_stone = pieces[first][0]
+        player.second_stone = pieces[second][0]
+        if reserved == no_stone:
+            player.reserved_stone = None
+        else:
+            player.reserved_stone = pieces[reserved][data[pos]]
+            pos += 1
+        player.lines = lines
+        player.score = score
+        player.garbage = garbage
+        player.over = bool(flags & 1)
+        board = player.board
+        for r in range(flags >> 1):
+            row_y = data[pos]
+            row = unpack_row(data, pos + 1, cols)
+            pos += 1 + row_bytes
+            board.cells[row_y] = row
+            mask = 0
+            for cx, val in enumerate(row):
+                if val:
+                    mask |= 1 << cx
+            board.masks[row_y] = mask
+        if flags >> 1:
+            board.update_columns()
+    return tick
+
+
+class Room:
+    def __init__(self, name, num_players, seed):
+        self.name = name
+        self.num_players = num_players
+        self.seed = seed
+        self.match = Match(num_players, seed, net_config['sim_hz'])
+        self.encoder = StateEncoder(num_players)
+        self.writers = []
+        self.tick = 0
+        self.inputs = {}  # tick -> [(player, action)], kept for the rollback window
+        self.snapshots = deque()  # (tick, match state)
+        self.rollbacks = 0
+
+    def full(self):
+        return len(self.writers) == self.num_players
+
+    def add_input(self, player, tick, action):
+        if tick < max(0, self.tick - net_config['rollback_window']):
+            tick = self.tick
+        # no further ahead than the window either, so a client can't pile up inputs that are never pruned
+        tick = min(tick, self.tick + net_config['rollback_window'])
+        self.inputs.setdefault(tick, []).append((player, action))
+        if tick < self.tick:
+            self.rollback(tick)
+
+    def rollback(self, tick):
+        # loading marks every row dirty, so keep what the boards looked like and only send the rows that come
+        # out different (plus whatever was already waiting to go)
+        before = [(player.board.dirty, list(player.board.masks), [row[:] for row in player.board.cells])
+                  for player in self.match.players]
+        while self.snapshots and self.snapshots[-1][0] > tick:
+            self.snapshots.pop()
+        snap_tick, state = self.snapshots[-1]
+        self.match.load(state)
+        target = self.tick
+        self.tick = snap_tick
+        while self.tick < target:
+            self.advance()
+        for player, (dirty, masks, cells) in zip(self.match.players, before):
+            board = player.board
+            for y in range(board.rows):
+                if board.masks[y] != masks[y] or board.cells[y] != cells[y]:
+                    dirty |= 1 << y
+            board.dirty = dirty
+        self.rollbacks += 1
+
+    def advance(self):
+        if self.tick % net_config['snapshot_every'] == 0:
+            if not self.snapshots or self.snapshots[-1][0] != self.tick:
+                self.snapshots.append((self.tick, self.match.save()))
+            while self.snapshots[0][0] < self.tick - net_config['rollback_window'] - net_config['snapshot_every']:
+                self.snapshots.popleft()
+                for old in [t for t in self.inputs if t < self.snapshots[0][0]]:
+                    del self.inputs[old]
+        self.match.step(self.inputs.get(self.tick, ()))
+        self.tick += 1
+
+
+class Server:
+    def __init__(self):
+        self.rooms = {}
+        self.waiting = {}  # room name -> room still filling up
+        self.bytes_sent = 0
+        self.ticks = 0
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        asyncio.ensure_future(self.tick_loop())
+        return server
+
+    async def handle(self, reader, writer):
+        room = None
+        player = None
+        try:
+            while True:
+                header = await reader.readexactly(frame.size)
+                data = await reader.readexactly(frame.unpack(header)[0])
+                if data[0] == INPUT and room is not None:
+                    kind, tick, action = input_msg.unpack(data)
+                    room.add_input(player, tick, action & 7)
+                elif data[0] == JOIN and room is None:
+                    kind, num_players = join_msg.unpack_from(data)
+                    room, player = self.join(data[join_msg.size:].decode(), num_players, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def join(self, name, num_players, writer):
+        room = self.waiting.get(name)
+        if room is None or room.num_players != num_players:
+            room = Room(name, num_players, random.randrange(1 << 32))
+            self.waiting[name] = room
+        player = len(room.writers)
+        room.writers.append(writer)
+        if room.full():
+            del self.waiting[name]
+            self.rooms[id(room)] = room
+            for i, room_writer in enumerate(room.writers):
+                self.send(room_writer, start_msg.pack(START, i, room.num_players, net_config['sim_hz'],
+                                                      config['delay'], room.seed, config['rows'], config['cols']))
+        return room, player
+
+    def send(self, writer, payload):
+        if not writer.is_closing():
+            writer.write(frame.pack(len(payload)) + payload)
+            self.bytes_sent += frame.size + len(payload)
+
+    def broadcast(self, room, payload):
+        data = frame.pack(len(payload)) + payload
+        for writer in room.writers:
+            if not writer.is_closing():
+                writer.write(data)
+                self.bytes_sent += len(data)
+
+    async def tick_loop(self):
+        loop = asyncio.get_event_loop()
+        step = 1.0 / net_config['sim_hz']
+        next_tick = loop.time()
+        while True:
+            for key, room in list(self.rooms.items()):
+                room.advance()
+                if room.match.over:
+                    self.broadcast(room, room.encoder.encode(room.tick, room.match.players, True))
+                    self.broadcast(room, end_msg.pack(END, room.tick))
+                    del self.rooms[key]
+                elif room.tick % net_config['send_every'] == 0:
+                    self.broadcast(room, room.encoder.encode(room.tick, room.match.players))
+            self.ticks += 1
+            next_tick += step
+            delay = next_tick - loop.time()
+            if delay < -step * 10:
+                next_tick = loop.time()  # too far behind, don't try to catch up
+            await asyncio.sleep(max(0.0, delay))
+
+
+class Client:
+    def __init__(self):
+        self.id = None
+        self.players = []
+        self.tick = 0
+        self.over = False
+        self.started = asyncio.Event()
+        self.messages = 0
+        self.bytes_received = 0
+        self.writer = None
+
+    async def connect(self, host, port, room, num_players):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        self.send(join_msg.pack(JOIN, num_players) + room.encode())
+        asyncio.ensure_future(self.read_loop(reader))
+
+    def send(self, payload):
+        self.writer.write(frame.pack(len(payload)) + payload)
+
+    def send_input(self, action):
+        self.send(input_msg.pack(INPUT, self.tick + net_config['input_delay'], action))
+
+    async def read_loop(self, reader):
+        try:
+            while not self.over:
+                header = await reader.readexactly(frame.size)
+                data = await reader.readexactly(frame.unpack(header)[0])
+                self.messages += 1
+                self.bytes_received += frame.size + len(data)
+                if data[0] == STATE:
+                    self.tick = decode_state(data, self.players, self.cols)
+                elif data[0] == START:
+                    (kind, self.id, num_players, self.sim_hz, self.delay, self.seed, rows,
+                     self.cols) = start_msg.unpack(data)
+                    self.players = [RemotePlayer(rows, self.cols) for i in range(num_players)]
+                    self.started.set()
+                elif data[0] == END:
+                    self.over = True
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.over = True
+        finally:
+            self.writer.close()
+
+
+async def random_client(host, port, room, num_players, seconds, rate):
+    # loopback test player: sends a random action rate times a second
+    client = Client()
+    await client.connect(host, port, room, num_players)
+    await client.started.wait()
+    end = time.perf_counter() + seconds
+    while not client.over and time.perf_counter() < end:
+        client.send_input(random.randrange(1, 8))
+        await asyncio.sleep(1.0 / rate)
+    client.writer.close()
+    return client
+
+
+async def loopback(matches, num_players, seconds, rate):
+    server = Server()
+    tcp = await server.serve('127.0.0.1', 0)
+    port = tcp.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    clients = await asyncio.gather(*[random_client('127.0.0.1', port, 'room%d' % m, num_players, seconds, rate)
+                                     for m in range(matches) for p in range(num_players)])
+    elapsed = time.perf_counter() - start
+    tcp.close()
+    received = sum(client.bytes_received for client in clients)
+    print('matches=%d players=%d server ticks/s=%.1f (target %d) sent=%.1f KB/s per client=%.0f B/s' % (
+        matches, num_players, server.ticks / elapsed, net_config['sim_hz'], server.bytes_sent / elapsed / 1024,
+        received / elapsed / len(clients)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tetris match server')
+    parser.add_argument('mode', choices=['serve', 'loopback'])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--matches', type=int, default=100)
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rate', type=float, default=5, help='inputs per second per loopback player')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if args.mode == 'serve':
+        loop.run_until_complete(Server().serve(args.host, args.port))
+        loop.run_forever()
+    else:
+        loop.run_until_complete(loopback(args.matches, args.players, args.seconds, args.rate))
+
+
+if __name__ == "__main__":
+    main()
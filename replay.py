@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# input recording and headless replay
+# a log is a header (seed, players, sim rate, gravity delay, garbage target, board size, randomizer) followed by
+# one record per input:
+#   varint tick delta since the previous record, then one byte player << 3 | action
+# the last record is a noop on the tick the game ended
+#   python replay.py last_game.rec
+
+import argparse
+import struct
+import time
+
+from core import config, Match, NOOP, garbage_targets, randomizers, set_geometry
+
+magic = b'TREC'
+version = 4
+# magic, version, players, sim_hz, base gravity delay, garbage target, seed, rows, cols, randomizer
+header = struct.Struct('<4sBBHHBQBBB')
+
+
+def write_varint(data, value):
+    while value > 0x7f:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class Recorder:
+    def __init__(self, num_players, seed, sim_hz, base_delay, garbage_target, rows=None, cols=None,
+                 randomizer=None):
+        randomizer = randomizers.index(randomizer or config['randomizer'])
+        self.data = bytearray(header.pack(magic, version, num_players, sim_hz, base_delay,
+                                          garbage_targets.index(garbage_target), seed, rows or config['rows'],
+                                          cols or config['cols'], randomizer))
+        self.tick = 0  # advanced by the caller once per sim step
+        self.last_tick = 0
+        self.finished = False
+
+    def record(self, player, action):
+        write_varint(self.data, self.tick - self.last_tick)
+        self.data.append(player << 3 | action)
+        self.last_tick = self.tick
+
+    def finish(self):
+        if not self.finished:
+            self.record(0, NOOP)
+            self.finished = True
+
+    def save(self, path):
+        self.finish()
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+def read_log(data):
+    tag, log_version, num_players, sim_hz, base_delay, target, seed, rows, cols, randomizer = header.unpack_from(data)
+    if tag != magic or log_version != version:
+        raise ValueError("not a replay log")
+    inputs = []
+    tick = 0
+    pos = header.size
+    while pos < len(data):
+        delta, pos = read_varint(data, pos)
+        tick += delta
+        inputs.append((tick, data[pos] >> 3, data[pos] & 7))
+        pos += 1
+    return num_players, seed, sim_hz, base_delay, garbage_targets[target], rows, cols, randomizers[randomizer], inputs
+
+
+def replay(data):
+    num_players, seed, sim_hz, base_delay, garbage_target, rows, cols, randomizer, inputs = read_log(data)
+    set_geometry(rows, cols)
+    match = Match(num_players, seed, sim_hz, base_delay, garbage_target, randomizer)
+    end = inputs[-1][0] if inputs else 0
+    i = 0
+    for tick in range(end + 1):
+        while i < len(inputs) and inputs[i][0] == tick:
+            match.players[inputs[i][1]].step(inputs[i][2])
+            i += 1
+        if tick == end or match.over:
+            break
+        match.gravity.step(match.players)
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description='replay recorded games headlessly')
+    parser.add_argument('logs', nargs='+')
+    args = parser.parse_args()
+
+    for path in args.logs:
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        match = replay(data)
+        elapsed = time.perf_counter() - start
+        game_seconds = match.gravity.ticks / (1000.0 / match.gravity.step_ms)
+        print(path, 'ticks=%d' % match.gravity.ticks, 'speedup=%.0fx' % (game_seconds / elapsed if elapsed else 0),
+              ' '.join('p%d: lines=%d score=%d' % (i + 1, p.lines, p.score) for i, p in enumerate(match.players)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# finished games in an sqlite database, only ever appended to
+# record() just queues the game, a writer thread commits whatever has queued up in one transaction, so the game
+# loop never waits on the disk. reads (the leaderboards) use their own connection and the database runs in
+# WAL mode, so they don't block the writer either.
+#   python scores.py top --players 1 --limit 10
+#   python scores.py top --by lines --mode local
+#   python scores.py modes
+
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+
+scores_config = {
+    'db_file': 'scores.db',
+    'batch': 500,  # most games in one transaction
+    'linger': 0.5,  # seconds the writer waits for more games before committing a batch
+}
+
+schema = '''
+create table if not exists games (
+    id integer primary key,
+    finished real not null,  -- unix time
+    mode text not null,  -- 'local' for app.py games, 'selfplay:<controllers>' for tournament.py
+    players integer not null,
+    seed integer not null,
+    rows integer not null,
+    cols integer not null,
+    randomizer text not null,
+    sim_hz integer not null,
+    ticks integer not null,
+    winner integer  -- player index, null for single player games
+);
+create table if not exists results (
+    game integer not null references games(id),
+    player integer not null,
+    mode text not null,  -- copied from games so the leaderboards are one index scan
+    players integer not null,
+    lines integer not null,
+    score integer not null,
+    pieces integer not null,
+    garbage integer not null,
+    piece_ticks blob  -- sim tick each piece locked on, uint32s
+);
+create index if not exists results_score on results(mode, players, score desc, lines desc);
+create index if not exists results_lines on results(mode, players, lines desc, score desc);
+create index if not exists games_finished on games(finished);
+'''
+
+leaderboards = {
+    'score': 'score desc, lines desc',
+    'lines': 'lines desc, score desc',
+}
+
+
+def signed(seed):
+    # sqlite integers are signed 64 bit, seeds are unsigned
+    return seed - (1 << 64) if seed >= 1 << 63 else seed
+
+
+def unsigned(seed):
+    return seed + (1 << 64) if seed < 0 else seed
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.execute('pragma journal_mode=wal')
+    db.execute('pragma synchronous=normal')
+    db.executescript(schema)
+    return db
+
+
+def insert(db, games):
+    with db:
+        for game in games:
+            cursor = db.execute(
+                'insert into games (finished, mode, players, seed, rows, cols, randomizer, sim_hz, ticks, winner) '
+                'values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (game['finished'], game['mode'], len(game['results']), signed(game['seed']), game['rows'],
+                 game['cols'], game['randomizer'], game['sim_hz'], game['ticks'], game['winner']))
+            game_id = cursor.lastrowid
+            db.executemany(
+                'insert into results (game, player, mode, players, lines, score, pieces, garbage, piece_ticks) '
+                'values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(game_id, i, game['mode'], len(game['results']), result['lines'], result['score'],
+                  result['pieces'], result['garbage'], array('I', result.get('piece_ticks', ())).tobytes())
+                 for i, result in enumerate(game['results'])])
+
+
+class Store:
+    def __init__(self, path=None):
+        self.path = path or scores_config['db_file']
+        self.queue = queue.Queue()
+        self.written = 0
+        self.reader = None
+        self.ready = threading.Event()  # set once the writer has the schema in place
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, game):
+        # game is a dict like the ones game_record makes, returns straight away
+        self.queue.put(game)
+
+    def write_loop(self):
+        # opening and setting up the database happens here too, so making a Store never waits on the disk
+        try:
+            db = connect(self.path)
+        finally:
+            self.ready.set()
+        done = False
+        while not done:
+            game = self.queue.get()
+            if game is None:
+                break
+            batch = [game]
+            deadline = time.monotonic() + scores_config['linger']
+            while len(batch) < scores_config['batch']:
+                try:
+                    game = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if game is None:
+                    done = True
+                    break
+                batch.append(game)
+            insert(db, batch)
+            self.written += len(batch)
+        db.close()
+
+    def close(self):
+        # writes whatever is still queued
+        self.queue.put(None)
+        self.thread.join()
+        if self.reader:
+            self.reader.close()
+
+    def read(self, sql, args=()):
+        if self.reader is None:
+            self.ready.wait()
+            self.reader = connect(self.path)
+        return self.reader.execute(sql, args).fetchall()
+
+    def top(self, players=1, mode='local', by='score', limit=10):
+        # (score, lines, pieces, player, seed, finished) best first
+        rows = self.read('select r.score, r.lines, r.pieces, r.player, g.seed, g.finished from results r '
+                         'join games g on g.id = r.game where r.mode = ? and r.players = ? '
+                         'order by %s limit ?' % leaderboards[by], (mode, players, limit))
+        return [row[:4] + (unsigned(row[4]),) + row[5:] for row in rows]
+
+    def modes(self):
+        # (mode, players, games, best score, average score, average lines)
+        return self.read('select mode, players, count(distinct game), max(score), avg(score), avg(lines) '
+                         'from results group by mode, players order by mode, players')
+
+    def piece_ticks(self, game, player):
+        rows = self.read('select piece_ticks from results where game = ? and player = ?', (game, player))
+        return array('I', rows[0][0]) if rows else array('I')
+
+
+def game_record(players, seed, mode, sim_hz, ticks, winner=None, randomizer=None):
+    # players are core.Game-likes (lines, score, pieces, garbage, and piece_ticks if they keep them)
+    board = players[0].board
+    return {
+        'finished': time.time(),
+        'mode': mode,
+        'seed': seed,
+        'rows': board.rows,
+        'cols': board.cols,
+        'randomizer': randomizer or players[0].queue.randomizer,
+        'sim_hz': sim_hz,
+        'ticks': ticks,
+        'winner': winner,
+        'results': [{'lines': p.lines, 'score': p.score, 'pieces': p.pieces, 'garbage': p.garbage,
+                     'piece_ticks': getattr(p, 'piece_ticks', ())} for p in players]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='leaderboards from the finished games store')
+    parser.add_argument('query', choices=['top', 'modes'])
+    parser.add_argument('--db', default=scores_config['db_file'])
+    parser.add_argument('--mode', default='local')
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--by', choices=sorted(leaderboards), default='score')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    store = Store(args.db)
+    if args.query == 'top':
+        for rank, (score, lines, pieces, player, seed, finished) in enumerate(
+                store.top(args.players, args.mode, args.by, args.limit)):
+            print('%2d. score=%d lines=%d pieces=%d  p%d seed=%d %s' % (
+                rank + 1, score, lines, pieces, player + 1, seed, time.strftime('%Y-%m-%d %H:%M',
+                                                                               time.localtime(finished))))
+    else:
+        for mode, players, games, best, score, lines in store.modes():
+            print('%s %d player: games=%d best=%d score=%.1f lines=%.1f' % (mode, players, games, best, score, lines))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
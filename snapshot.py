@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# fixed layout binary snapshots of a whole game, written and read through mmap
+# a snapshot is the header, the garbage router's rng and then one block per player:
+#   stone, position, previews, reserve, counters, rng state, piece queue and its rng, and the board colors
+#   (one byte per cell, row major)
+# every snapshot of the same board size and player count has the same size, so an archive is just snapshots
+# back to back and snapshot i starts at i * size.
+#   python snapshot.py saved_game.snap
+#   python snapshot.py archive.snap --boards
+
+import argparse
+import mmap
+import os
+import struct
+import time
+
+from core import Match, garbage_targets, randomizers, pieces, set_geometry
+
+magic = b'TSNP'
+version = 2
+# magic, version, rows, cols, players, sim_hz, base delay, garbage target, seed, gravity elapsed, gravity delay,
+# next garbage target, ticks, over
+header = struct.Struct('<4sBBBBHHBQdIIQB')
+# random.Random state: 624 words and the index, then whether a gauss value is waiting and the value
+rng_block = struct.Struct('<625IBd')
+# stone, rotation, x, y, first, second, reserved stone (255 = none), its rotation, reserved this turn, lines,
+# score, pieces, rand_line_counter, garbage_queue, garbage, over
+player_block = struct.Struct('<BBhhBBBBBIIIIIIB')
+# randomizer, how many queued pieces follow, randomizer history (255 = empty), the queued piece indexes
+queue_slots = 64
+queue_block = struct.Struct('<BB4B%dB' % queue_slots)
+
+no_stone = 255
+# board colors to '0'/'1' so a row turns into its bitmask with one int() call
+mask_bits = bytes([48] + [49] * 255)
+
+
+def snapshot_size(num_players, rows, cols):
+    return header.size + rng_block.size + num_players * player_size(rows, cols)
+
+
+def player_size(rows, cols):
+    return player_block.size + rng_block.size + queue_block.size + rng_block.size + rows * cols
+
+
+def pack_rng(buf, offset, rng):
+    rng_version, words, gauss = rng.getstate()
+    rng_block.pack_into(buf, offset, *words, gauss is not None, gauss or 0.0)
+
+
+def unpack_rng(buf, offset, rng):
+    values = rng_block.unpack_from(buf, offset)
+    gauss = values[626] if values[625] else None
+    rng.setstate((3, values[:625], gauss))
+
+
+def write_state(buf, offset, players, gravity, seed, over):
+    board = players[0].board
+    router = gravity.router
+    header.pack_into(buf, offset, magic, version, board.rows, board.cols, len(players),
+                     round(1000.0 / gravity.step_ms), gravity.base_delay, garbage_targets.index(router.target), seed,
+                     gravity.elapsed, gravity.delay, router.next_target, gravity.ticks, over)
+    offset += header.size
+    pack_rng(buf, offset, router.rng)
+    offset += rng_block.size
+    for player in players:
+        reserved = player.reserved_stone
+        player_block.pack_into(buf, offset, player.stone.index, player.stone.rotation, player.stone_x, player.stone_y,
+                               player.first_stone.index, player.second_stone.index,
+                               reserved.index if reserved else no_stone, reserved.rotation if reserved else 0,
+                               player.reserved, player.lines, player.score, player.pieces, player.rand_line_counter,
+                               player.garbage_queue, player.garbage, player.over)
+        offset += player_block.size
+        pack_rng(buf, offset, player.rng)
+        offset += rng_block.size
+        queue = player.queue
+        upcoming = queue.upcoming()
+        history = queue.history + [no_stone] * (4 - len(queue.history))
+        queue_block.pack_into(buf, offset, randomizers.index(queue.randomizer), len(upcoming), *history, *upcoming,
+                              *[0] * (queue_slots - len(upcoming)))
+        offset += queue_block.size
+        pack_rng(buf, offset, queue.rng)
+        offset += rng_block.size
+        cols = player.board.cols
+        for row in player.board.cells:
+            buf[offset:offset + cols] = bytes(row)
+            offset += cols
+    return offset
+
+
+def read_header(buf, offset=0):
+    if len(buf) - offset < header.size:
+        raise ValueError("not a game snapshot")
+    values = header.unpack_from(buf, offset)
+    if values[0] != magic or values[1] != version:
+        raise ValueError("not a game snapshot")
+    return values
+
+
+def read_state(buf, offset, players, gravity):
+    # loads a snapshot into existing players and gravity of the same size, returns (seed, over)
+    (tag, snap_version, rows, cols, num_players, sim_hz, base_delay, target, seed, gravity.elapsed, gravity.delay,
+     next_target, gravity.ticks, over) = read_header(buf, offset)
+    if num_players != len(players) or (rows, cols) != (players[0].board.rows, players[0].board.cols):
+        raise ValueError("snapshot is for a different game size")
+    gravity.step_ms = 1000.0 / sim_hz
+    gravity.base_delay = base_delay
+    router = gravity.router
+    router.target = garbage_targets[target]
+    router.next_target = next_target
+    offset += header.size
+    unpack_rng(buf, offset, router.rng)
+    offset += rng_block.size
+    for player in players:
+        (stone, rotation, player.stone_x, player.stone_y, first, second, reserved, reserved_rotation, player_reserved,
+         player.lines, player.score, player.pieces, player.rand_line_counter, player.garbage_queue, player.garbage,
+         player_over) = player_block.unpack_from(buf, offset)
+        player.set_stone(pieces[stone][rotation])
+        player.reserved_stone = pieces[reserved][reserved_rotation] if reserved != no_stone else None
+        player.reserved = bool(player_reserved)
+        player.over = bool(player_over)
+        offset += player_block.size
+        unpack_rng(buf, offset, player.rng)
+        offset += rng_block.size
+        values = queue_block.unpack_from(buf, offset)
+        queue = player.queue
+        queue.randomizer = randomizers[values[0]]
+        queue.history = [index for index in values[2:6] if index != no_stone]
+        queue.indexes = list(values[6:6 + values[1]])
+        queue.pos = 0
+        offset += queue_block.size
+        unpack_rng(buf, offset, queue.rng)
+        offset += rng_block.size
+        board = player.board
+        for y in range(rows):
+            row = bytes(buf[offset:offset + cols])
+            board.cells[y] = list(row)
+            board.masks[y] = int(row.translate(mask_bits)[::-1], 2)
+            offset += cols
+        board.update_columns()
+    return seed, bool(over)
+
+
+def save(path, players, gravity, seed, over=False):
+    # written next to the old file and swapped in, so a crash mid-save leaves the last good snapshot
+    board = players[0].board
+    size = snapshot_size(len(players), board.rows, board.cols)
+    tmp_path = path + '.tmp'
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        with mmap.mmap(fd, size) as mm:
+            write_state(mm, 0, players, gravity, seed, over)
+            mm.flush()
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def load_header(path):
+    # raises ValueError for anything that isn't a whole snapshot this version can load
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            values = read_header(mm)
+            if len(mm) != snapshot_size(values[4], values[2], values[3]):
+                raise ValueError("snapshot is cut short")
+            return values
+
+
+def load(path, players, gravity):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return read_state(mm, 0, players, gravity)
+
+
+def save_match(path, match):
+    save(path, match.players, match.gravity, match.seed, match.over)
+
+
+def load_match(path):
+    # builds a Match of the snapshot's size and settings and loads it
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            values = read_header(mm)
+            rows, cols, num_players, sim_hz, base_delay, target, seed = values[2:9]
+            set_geometry(rows, cols)
+            match = Match(num_players, seed, sim_hz, base_delay, garbage_targets[target])
+            match.seed, match.over = read_state(mm, 0, match.players, match.gravity)
+    return match
+
+
+def append(path, match):
+    # adds a snapshot to the end of an archive
+    board = match.players[0].board
+    data = bytearray(snapshot_size(len(match.players), board.rows, board.cols))
+    write_state(data, 0, match.players, match.gravity, match.seed, match.over)
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+class Archive:
+    # read-only view of a snapshot archive, boards come back as memoryviews into the mapping (no copies)
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        values = read_header(self.mm)
+        self.rows, self.cols, self.num_players = values[2:5]
+        self.size = snapshot_size(self.num_players, self.rows, self.cols)
+        if len(self.mm) % self.size:
+            raise ValueError("archive snapshots differ in size")
+
+    def __len__(self):
+        return len(self.mm) // self.size
+
+    def header(self, i):
+        return read_header(self.mm, i * self.size)
+
+    def player(self, i, player):
+        # the player_block fields of one player
+        return player_block.unpack_from(self.mm, self.player_offset(i, player))
+
+    def player_offset(self, i, player):
+        return i * self.size + header.size + rng_block.size + player * player_size(self.rows, self.cols)
+
+    def board(self, i, player):
+        # rows x cols memoryview of the colors, index with board[y, x]. release() it before close()
+        start = self.player_offset(i, player) + player_size(self.rows, self.cols) - self.rows * self.cols
+        return self.view[start:start + self.rows * self.cols].cast('B', (self.rows, self.cols))
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='show what is in a snapshot file or archive')
+    parser.add_argument('path')
+    parser.add_argument('--boards', action='store_true', help='print every board')
+    args = parser.parse_args()
+
+    archive = Archive(args.path)
+    start = time.perf_counter()
+    filled = 0
+    for i in range(len(archive)):
+        values = archive.header(i)
+        print('snapshot %d: %dx%d players=%d seed=%d ticks=%d over=%d' % (
+            i, values[3], values[2], values[4], values[8], values[12], values[13]))
+        for p in range(archive.num_players):
+            fields = archive.player(i, p)
+            board = archive.board(i, p)
+            filled += sum(1 for cell in board.tobytes() if cell)
+            print('  p%d: lines=%d score=%d pieces=%d garbage=%d over=%d' % (
+                p + 1, fields[9], fields[10], fields[11], fields[14], fields[15]))
+            if args.boards:
+                for y in range(archive.rows):
+                    print('   ', ''.join('#' if board[y, x] else '.' for x in range(archive.cols)))
+            board.release()
+    print('%d snapshots, %d filled cells, %.1fms' % (len(archive), filled, (time.perf_counter() - start) * 1000))
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+# spectator streams
+# a Publisher turns a set of players into net STATE messages (only the players and board rows that changed,
+# keyframes now and then) and a Relay fans each message out to any number of subscribers: every message is
+# framed once and the same bytes are written to every socket. a subscriber joining mid-match gets the last
+# keyframe and the deltas since, one that falls too far behind is dropped.
+#   python app.py --spectate 7778, then python spectate.py watch --port 7778
+#   python spectate.py bench --subscribers 2000 --seconds 10
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import threading
+import time
+
+from core import config, Match
+from net import net_config, frame, start_msg, state_head, START, StateEncoder, Client
+
+spectate_config = {
+    'max_backlog': 256 * 1024,  # bytes waiting on one subscriber's socket before it is dropped
+    'listen_backlog': 1024,  # connections waiting to be accepted, spectators tend to arrive all at once
+}
+
+SPECTATOR = 255  # player id in the START message spectators get
+
+
+class Publisher:
+    def __init__(self, players, seed, sim_hz=None, base_delay=None):
+        self.sim_hz = sim_hz or config['sim_hz']
+        self.base_delay = base_delay or config['delay']
+        self.restart(players, seed)
+
+    def restart(self, players, seed):
+        # a new game on the same stream, the next message is a keyframe
+        self.players = players
+        self.encoder = StateEncoder(len(players))
+        board = players[0].board
+        self.hello = start_msg.pack(START, SPECTATOR, len(players), self.sim_hz, self.base_delay, seed, board.rows,
+                                    board.cols)
+
+    def publish(self, tick):
+        return self.encoder.encode(tick, self.players)
+
+
+def is_keyframe(payload):
+    return payload[state_head.size - 2]
+
+
+class Relay:
+    def __init__(self, hello):
+        self.subscribers = set()
+        self.hello = frame.pack(len(hello)) + hello
+        self.backlog = []  # framed messages since the last keyframe, keyframe first
+        self.messages = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.loop = None
+
+    async def serve(self, host, port):
+        self.loop = asyncio.get_event_loop()
+        return await asyncio.start_server(self.handle, host, port, backlog=spectate_config['listen_backlog'])
+
+    async def handle(self, reader, writer):
+        writer.write(self.hello)
+        for data in self.backlog:
+            writer.write(data)
+        self.subscribers.add(writer)
+        try:
+            await reader.read()  # spectators don't send anything, this returns when they hang up
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    def restart(self, hello):
+        self.hello = frame.pack(len(hello)) + hello
+        self.backlog = []
+        self.send(self.hello)
+
+    def publish(self, payload):
+        data = frame.pack(len(payload)) + payload
+        if is_keyframe(payload):
+            self.backlog = [data]
+        elif self.backlog:
+            self.backlog.append(data)
+        self.messages += 1
+        self.send(data)
+
+    def send(self, data):
+        limit = spectate_config['max_backlog']
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > limit:
+                self.subscribers.discard(writer)
+                writer.close()
+                self.dropped += 1
+            else:
+                writer.write(data)
+                self.bytes_sent += len(data)
+
+    # for a relay running on another thread's loop (see start_relay)
+    def publish_threadsafe(self, payload):
+        self.loop.call_soon_threadsafe(self.publish, payload)
+
+    def restart_threadsafe(self, hello):
+        self.loop.call_soon_threadsafe(self.restart, hello)
+
+
+def start_relay(hello, host, port):
+    # runs a relay on its own thread and event loop, for publishers that aren't asyncio (app.py)
+    relay = Relay(hello)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(relay.serve(host, port))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return relay
+
+
+class Spectator(Client):
+    # a net.Client that watches instead of joining
+    async def connect(self, host, port):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        asyncio.ensure_future(self.read_loop(reader))
+
+
+async def count_bytes(host, port, counts, i):
+    # cheap benchmark subscriber, only counts what arrives
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            counts[i] += len(data)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def subscriber_process(host, port, count, results):
+    # count benchmark subscribers on their own process, so the relay's numbers are only the relay's
+    async def run():
+        counts = [0] * count
+        tasks = []
+        for start in range(0, count, 200):
+            tasks += [asyncio.ensure_future(count_bytes(host, port, counts, i))
+                      for i in range(start, min(start + 200, count))]
+            await asyncio.sleep(0.1)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return sum(counts)
+    results.put(asyncio.run(run()))
+
+
+async def bench(subscribers, seconds, num_players, decoders, procs, seed):
+    match = Match(num_players, seed, net_config['sim_hz'])
+    publisher = Publisher(match.players, seed, net_config['sim_hz'])
+    relay = Relay(publisher.hello)
+    tcp = await relay.serve('127.0.0.1', 0)
+    port = tcp.sockets[0].getsockname()[1]
+
+    results = multiprocessing.Queue()
+    for n in range(procs):
+        count = subscribers // procs + (n < subscribers % procs)
+        multiprocessing.Process(target=subscriber_process, args=('127.0.0.1', port, count, results),
+                                daemon=True).start()
+    spectators = []
+    for i in range(decoders):
+        spectator = Spectator()
+        await spectator.connect('127.0.0.1', port)
+        spectators.append(spectator)
+    while len(relay.subscribers) < subscribers + decoders:
+        await asyncio.sleep(0.01)
+
+    rng = random.Random(seed)
+    loop = asyncio.get_event_loop()
+    step = 1.0 / net_config['sim_hz']
+    encode_time = 0.0
+    fan_out_time = 0.0
+    games = 1
+    start = loop.time()
+    next_tick = start
+    tick = 0
+    while loop.time() - start < seconds:
+        match.step([(rng.randrange(num_players), rng.randrange(1, 8))])
+        tick += 1
+        if match.over:
+            match = Match(num_players, seed + games, net_config['sim_hz'])
+            games += 1
+            publisher.restart(match.players, seed + games)
+            relay.restart(publisher.hello)
+        if tick % net_config['send_every'] == 0:
+            t0 = time.perf_counter()
+            payload = publisher.publish(tick)
+            t1 = time.perf_counter()
+            relay.publish(payload)
+            t2 = time.perf_counter()
+            encode_time += t1 - t0
+            fan_out_time += t2 - t1
+        next_tick += step
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+    elapsed = loop.time() - start
+    payload = publisher.publish(tick)
+    relay.publish(payload)
+    await asyncio.sleep(0.5)
+
+    for writer in list(relay.subscribers):
+        writer.close()
+    tcp.close()
+    received = 0
+    for n in range(procs):
+        received += await loop.run_in_executor(None, results.get)
+    await asyncio.sleep(0.1)
+
+    in_sync = all(spectator.players[i].board.cells == player.board.cells and
+                  spectator.players[i].score == player.score
+                  for spectator in spectators for i, player in enumerate(match.players))
+    print('subscribers=%d players=%d games=%d ticks/s=%.1f (target %d) messages=%d dropped=%d' % (
+        subscribers + decoders, num_players, games, tick / elapsed, net_config['sim_hz'], relay.messages,
+        relay.dropped))
+    print('encode %.1fus/msg  fan-out %.1fus/msg (%.2fus per subscriber)  sent %.1f MB/s  received %.1f MB/s' % (
+        encode_time / relay.messages * 1e6, fan_out_time / relay.messages * 1e6,
+        fan_out_time / relay.messages / max(1, subscribers + decoders) * 1e6, relay.bytes_sent / elapsed / 1e6,
+        received / elapsed / 1e6))
+    if spectators:
+        print('decoding spectators in sync:', in_sync)
+
+
+async def watch(host, port):
+    spectator = Spectator()
+    await spectator.connect(host, port)
+    while not spectator.over:
+        await asyncio.sleep(1)
+        if spectator.players:
+            print('tick %d  ' % spectator.tick + '  '.join('p%d: lines=%d score=%d' % (i + 1, p.lines, p.score)
+                                                           for i, p in enumerate(spectator.players)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='spectator relay tools')
+    parser.add_argument('mode', choices=['bench', 'watch'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7778)
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--decoders', type=int, default=4, help='subscribers that also decode and check the stream')
+    parser.add_argument('--procs', type=int, default=1, help='processes running the subscribers')
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if args.mode == 'bench':
+        loop.run_until_complete(bench(args.subscribers, args.seconds, args.players, args.decoders, args.procs,
+                                      args.seed))
+    else:
+        loop.run_until_complete(watch(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import os
+import random
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+import app
+from core import config, LEFT, RIGHT, DOWN, ROTATE_CW, RESERVE, DROP_ALL
+from replay import Recorder, read_log
+
+
+def test_input_is_dropped_unless_playing():
+    recorder = Recorder(1, 5, config['sim_hz'], config['delay'], config['garbage_target'])
+    player = app.Player(0, 5)
+    player.recorder = recorder
+    before = player.save()
+    try:
+        for state in ('paused', 'gameover', 'starting'):
+            config['game_state'] = state
+            for action in (LEFT, ROTATE_CW, RESERVE, DROP_ALL):
+                player.step(action)
+            assert player.save() == before
+        assert read_log(bytes(recorder.data))[-1] == []
+
+        # the same actions while playing are applied and logged
+        config['game_state'] = 'normal'
+        player.step(LEFT)
+        player.step(RESERVE)
+        assert player.save() != before
+        assert [action for tick, id_num, action in read_log(bytes(recorder.data))[-1]] == [LEFT, RESERVE]
+    finally:
+        config['game_state'] = 'starting'
+
+
+def test_partial_rescale_matches_a_full_one():
+    rng = random.Random(1)
+    config['game_state'] = 'normal'
+    try:
+        for size in ((541, 720), (300, 300), (225, 300), (700, 1000)):
+            player = app.Player(0, 3)
+            player.scale_to(size)
+            for frame in range(150):
+                player.step(rng.choice((LEFT, RIGHT, ROTATE_CW, DOWN, DOWN, DROP_ALL, RESERVE)))
+                if rng.random() < 0.05:
+                    player.add_rand_lines(1)
+                if player.over:
+                    break
+                surface, rects = player.present(player.update_screen())
+                full = pygame.transform.scale(player.screen, size)
+                assert pygame.image.tobytes(surface, 'RGB') == pygame.image.tobytes(full, 'RGB')
+    finally:
+        config['game_state'] = 'starting'
+
+
+def test_trace_key_starts_recording_then_writes(tmp_path):
+    path = str(tmp_path / 'trace.json')
+    saved = dict((key, config[key]) for key in ('trace_file', 'profile', 'overlay'))
+    config.update({'trace_file': path, 'profile': False, 'overlay': False})
+    app.frame_timer.enabled = False
+    try:
+        app.dump_trace()
+        assert app.frame_timer.enabled and not os.path.exists(path)
+        app.frame_timer.start_frame()
+        app.frame_timer.end_frame()
+        app.dump_trace()
+        with open(path) as f:
+            assert json.load(f)['traceEvents']
+    finally:
+        config.update(saved)
+        app.frame_timer.enabled = config['profile'] or config['overlay']
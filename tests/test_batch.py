@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+from batch import BatchGame
+from core import Game, PieceQueue
+from tournament import BotController
+
+
+class QueuedBatch(BatchGame):
+    # one board that draws the pieces a core.Game with the same seed gets
+    def __init__(self, seed):
+        self.source = PieceQueue(random.Random(seed).getrandbits(64))
+        BatchGame.__init__(self, 1)
+
+    def draw(self, idx):
+        return np.array([self.source.next().index for i in idx])
+
+
+def test_batch_game_plays_like_core_game():
+    actions = 0
+    seed = 0
+    while actions < 20000:
+        game = Game(seed)
+        batch = QueuedBatch(seed)
+        bot = BotController(seed, depth=1)
+        while not game.over and actions < 20000:
+            # mostly the bot's plan so lines get cleared, with random moves and reserves mixed in
+            action = bot.act(game) if random.Random(actions).random() < 0.95 else actions % 7 + 1
+            game.step(action)
+            batch.step([action])
+            actions += 1
+            reserved = game.reserved_stone
+            assert batch.boards[0].tolist() == game.board.cells
+            assert (batch.piece[0], batch.rotation[0], batch.stone_x[0], batch.stone_y[0]) == \
+                (game.stone.index, game.stone.rotation, game.stone_x, game.stone_y)
+            assert (batch.first_stone[0], batch.second_stone[0]) == (game.first_stone.index, game.second_stone.index)
+            assert batch.reserved_piece[0] == (reserved.index if reserved else -1)
+            assert (batch.lines[0], batch.score[0], batch.over[0]) == (game.lines, game.score, game.over)
+        seed += 1
+    assert seed > 1
@@ -0,0 +1,41 @@
+import random
+
+from core import Game
+
+
+def random_play(seed, moves=3000, garbage=0.05):
+    # random inputs with gravity and garbage now and then, yields the game after every move
+    rng = random.Random(seed)
+    game = Game(seed)
+    for i in range(moves):
+        if game.over:
+            game = Game(seed + i)
+        game.step(rng.randrange(1, 8))
+        if rng.random() < 0.3:
+            game.drop()
+        if rng.random() < garbage:
+            game.add_rand_lines(rng.randrange(1, 4))
+        yield game
+
+
+def test_masks_columns_and_cells_agree():
+    for game in random_play(1):
+        board = game.board
+        for y in range(board.rows):
+            assert board.masks[y] == sum(1 << x for x in range(board.cols) if board.cells[y][x])
+            for x in range(board.cols):
+                assert board.columns[x] >> y & 1 == board.masks[y] >> x & 1
+
+
+def test_stack_summary_matches_full_recompute():
+    for game in random_play(2):
+        board = game.board
+        heights = []
+        holes = []
+        for x in range(board.cols):
+            filled = [y for y in range(board.rows) if board.masks[y] >> x & 1]
+            heights.append(board.rows - filled[0] if filled else 0)
+            holes.append(heights[-1] - len(filled))
+        assert board.heights == heights
+        assert board.holes == holes
+        assert board.max_height == max(heights)
@@ -0,0 +1,13 @@
+from env import TetrisEnv, env_seeds
+
+
+def test_env_seeds_never_repeat():
+    seeds = env_seeds(1, 1000)
+    assert len(set(seeds)) == 1000
+    assert seeds == env_seeds(1, 1000)
+    # envs 0 and 256 shared a seed when they were seeded like match players
+    first = TetrisEnv(seeds[0])
+    other = TetrisEnv(seeds[256])
+    first.reset()
+    other.reset()
+    assert first.game.queue.upcoming() != other.game.queue.upcoming()
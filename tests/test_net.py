@@ -0,0 +1,68 @@
+import random
+
+from core import LEFT, RIGHT, DOWN
+from net import Room, RemotePlayer, decode_state, net_config
+from tournament import BotController
+
+
+def test_late_inputs_end_like_inputs_on_time():
+    ticks = 1500
+    on_time = Room('a', 2, 9)
+    late = Room('b', 2, 9)
+    # bots play on the on time room so lines get cleared and garbage goes across, the late room gets the same
+    # inputs with player 2's held back
+    bots = [BotController(i, depth=1) for i in range(2)]
+    inputs = []
+    remote = [RemotePlayer(late.match.players[0].board.rows, late.match.players[0].board.cols) for i in range(2)]
+    cols = remote[0].board.cols
+    rng = random.Random(2)
+    # player 2's input for each tick turns up to 24 ticks late, in order
+    arrivals = {}
+    arrive = 0
+    for tick in range(ticks):
+        arrive = max(arrive, tick + rng.randrange(25))
+        arrivals.setdefault(arrive, []).append(tick)
+    for tick in range(ticks):
+        inputs.append([bot.act(player) for bot, player in zip(bots, on_time.match.players)])
+        for player, action in enumerate(inputs[tick]):
+            if action:
+                on_time.add_input(player, tick, action)
+        on_time.advance()
+
+        if inputs[tick][0]:
+            late.add_input(0, tick, inputs[tick][0])
+        for sent in arrivals.get(tick, ()):
+            if inputs[sent][1]:
+                late.add_input(1, sent, inputs[sent][1])
+        late.advance()
+        if tick % net_config['send_every'] == 0:
+            decode_state(late.encoder.encode(late.tick, late.match.players), remote, cols)
+        if on_time.match.over:
+            break
+    # whatever is still on its way arrives now
+    for arrive in sorted(arrivals):
+        if arrive > tick:
+            for sent in arrivals[arrive]:
+                if sent <= tick and inputs[sent][1]:
+                    late.add_input(1, sent, inputs[sent][1])
+    decode_state(late.encoder.encode(late.tick, late.match.players), remote, cols)
+
+    assert late.rollbacks > 0
+    assert late.match.save() == on_time.match.save()
+    for player, mirror in zip(late.match.players, remote):
+        assert mirror.board.cells == player.board.cells
+        assert (mirror.lines, mirror.score, mirror.garbage) == (player.lines, player.score, player.garbage)
+
+
+def test_input_ticks_are_clamped():
+    room = Room('c', 2, 3)
+    room.advance()
+    room.add_input(0, -5, LEFT)  # before the first tick, played now
+    assert room.inputs[room.tick] == [(0, LEFT)]
+    for i in range(net_config['rollback_window'] + 10):
+        room.advance()
+    room.add_input(1, room.tick - net_config['rollback_window'] - 1, RIGHT)  # too late to roll back for
+    assert room.inputs[room.tick] == [(1, RIGHT)]
+    room.add_input(0, room.tick + 10 ** 6, DOWN)  # no further ahead than the window
+    assert room.inputs[room.tick + net_config['rollback_window']] == [(0, DOWN)]
+    assert room.rollbacks == 0
@@ -0,0 +1,41 @@
+import random
+
+from core import config, Match
+from replay import Recorder, read_log, replay
+from tournament import BotController
+
+
+def play(seed, num_players=2, max_ticks=3000):
+    # a match driven like app.py drives one: inputs land on the current tick, then gravity steps.
+    # bots play so lines get cleared and garbage goes back and forth, at random moments so ticks get
+    # zero, one or more inputs
+    rng = random.Random(seed)
+    match = Match(num_players, seed)
+    controllers = [BotController(seed + i, depth=1) for i in range(num_players)]
+    recorder = Recorder(num_players, seed, config['sim_hz'], config['delay'], config['garbage_target'])
+    while not match.over and match.gravity.ticks < max_ticks:
+        for i, controller in enumerate(controllers):
+            if rng.random() < 0.5:
+                action = controller.act(match.players[i])
+                if action:
+                    recorder.record(i, action)
+                    match.players[i].step(action)
+        if match.over:
+            break
+        match.gravity.step(match.players)
+        recorder.tick = match.gravity.ticks
+    recorder.finish()
+    return match, bytes(recorder.data)
+
+
+def test_replay_gives_the_same_boards():
+    for seed in range(3):
+        match, log = play(seed)
+        assert read_log(log)[1] == seed
+        replayed = replay(log)
+        assert replayed.over == match.over
+        for player, other in zip(match.players, replayed.players):
+            assert other.board.masks == player.board.masks
+            assert other.board.cells == player.board.cells
+            assert (other.lines, other.score, other.pieces, other.garbage) == \
+                (player.lines, player.score, player.pieces, player.garbage)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# frame phase timers for run(), cheap enough to leave in the loop - everything is a no-op unless enabled
+# dump() writes a chrome trace-event json (open it in chrome://tracing or ui.perfetto.dev)
+
+import json
+import time
+from collections import deque
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class FrameTimer:
+    def __init__(self, enabled=False, history=600, max_events=200000):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.starts = {}
+        self.events = deque(maxlen=max_events)  # (name, start, duration) in seconds since origin
+
+        self.frame_start = None
+        self.input_time = None
+        self.walls = deque(maxlen=history)  # frame to frame time, waiting included
+        self.frames = deque(maxlen=history)  # time spent working on each frame
+        self.latencies = deque(maxlen=history)  # first input handled -> next display update
+
+    def begin(self, name):
+        if self.enabled:
+            self.starts[name] = time.perf_counter()
+
+    def end(self, name):
+        if self.enabled:
+            now = time.perf_counter()
+            start = self.starts.pop(name, now)
+            self.events.append((name, start - self.origin, now - start))
+
+    def start_frame(self):
+        if self.enabled:
+            now = time.perf_counter()
+            if self.frame_start is not None:
+                self.walls.append(now - self.frame_start)
+            self.frame_start = now
+
+    def end_frame(self):
+        # call before waiting for the next frame
+        if self.enabled and self.frame_start is not None:
+            now = time.perf_counter()
+            self.frames.append(now - self.frame_start)
+            self.events.append(('frame', self.frame_start - self.origin, now - self.frame_start))
+
+    def input(self):
+        if self.enabled and self.input_time is None:
+            self.input_time = time.perf_counter()
+
+    def presented(self):
+        if self.enabled and self.input_time is not None:
+            self.latencies.append(time.perf_counter() - self.input_time)
+            self.input_time = None
+
+    def stats(self):
+        stats = {'fps': 0.0, 'frame_p50_ms': 0.0, 'frame_p99_ms': 0.0, 'input_p50_ms': 0.0, 'input_p99_ms': 0.0}
+        if self.walls:
+            stats['fps'] = len(self.walls) / sum(self.walls)
+        if self.frames:
+            stats['frame_p50_ms'] = percentile(self.frames, 50) * 1000
+            stats['frame_p99_ms'] = percentile(self.frames, 99) * 1000
+        if self.latencies:
+            stats['input_p50_ms'] = percentile(self.latencies, 50) * 1000
+            stats['input_p99_ms'] = percentile(self.latencies, 99) * 1000
+        return stats
+
+    def dump(self, path):
+        trace = []
+        for name, start, duration in self.events:
+            trace.append({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': 0, 'tid': 0})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+# self-play / tournament runner
+# plays seeded headless matches on a process pool, each player driven by a controller that feeds actions to
+# Game.step like a key press. one json line per game is appended to the results file as soon as it finishes.
+#   python tournament.py --games 1000 --players 1 2 4 --controllers bot random --workers 8
+#   python tournament.py --games 1000 --resume   (skips the games already in the results file)
+#   python tournament.py --games 1000 --db scores.db   (also keeps them in the scores.py store)
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from core import config, Match, player_seed, LEFT, RIGHT, DOWN, DROP_ALL, ROTATE_CW, ROTATE_CCW, RESERVE
+from bot import Bot
+from scores import Store
+
+scripted_actions = [LEFT, RIGHT, DOWN, DOWN, DROP_ALL, ROTATE_CW, ROTATE_CCW, RESERVE]
+
+
+class RandomController:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def act(self, game):
+        return self.rng.choice(scripted_actions)
+
+
+class BotController:
+    # plans once per stone and then plays the plan back one action per turn
+    def __init__(self, seed, **settings):
+        self.bot = Bot(**settings)
+        self.actions = []
+        self.pieces = None
+
+    def act(self, game):
+        if game.pieces != self.pieces:
+            self.pieces = game.pieces
+            plan = self.bot.plan(game)
+            self.actions = list(plan.actions) if plan else [DROP_ALL]
+            self.actions.reverse()
+        if self.actions:
+            return self.actions.pop()
+        return 0
+
+
+controllers = {
+    'random': RandomController,
+    'bot': BotController
+}
+
+
+def play(job):
+    seed = job['seed']
+    match = Match(job['players'], seed, job['sim_hz'])
+    names = job['controllers']
+    players = []
+    for i in range(job['players']):
+        settings = job['bot'] if names[i] == 'bot' else {}
+        players.append(controllers[names[i]](player_seed(seed, i), **settings))
+    start = time.perf_counter()
+    tick = 0
+    piece_ticks = [[] for p in match.players]  # tick each piece locked on
+    while not match.over and tick < job['max_ticks']:
+        inputs = []
+        if tick % job['every'] == 0:
+            for i, controller in enumerate(players):
+                action = controller.act(match.players[i])
+                if action:
+                    inputs.append((i, action))
+        match.step(inputs)
+        tick += 1
+        for i, p in enumerate(match.players):
+            if p.pieces != len(piece_ticks[i]):
+                piece_ticks[i].append(tick)
+
+    stats = [{'controller': names[i], 'lines': p.lines, 'score': p.score, 'pieces': p.pieces, 'garbage': p.garbage,
+              'over': p.over, 'piece_ticks': piece_ticks[i]} for i, p in enumerate(match.players)]
+    # the player still standing wins, on a timeout the most lines (then score) does
+    winner = max(range(len(stats)), key=lambda i: (not stats[i]['over'], stats[i]['lines'], stats[i]['score']))
+    return {'seed': seed, 'players': job['players'], 'ticks': tick, 'game_seconds': tick / job['sim_hz'],
+            'seconds': time.perf_counter() - start, 'winner': winner, 'stats': stats}
+
+
+def job_list(args, done):
+    for players in args.players:
+        for i in range(args.games):
+            seed = args.seed + i
+            if (seed, players) in done:
+                continue
+            yield {
+                'seed': seed,
+                'players': players,
+                'controllers': [args.controllers[n % len(args.controllers)] for n in range(players)],
+                'sim_hz': args.sim_hz,
+                'every': args.every,
+                'max_ticks': int(args.max_seconds * args.sim_hz),
+                'bot': {'depth': args.depth, 'budget': args.budget, 'beam': args.beam}
+            }
+
+
+def store_record(job, result):
+    # a result in the shape scores.Store takes
+    return {
+        'finished': time.time(),
+        'mode': 'selfplay:' + '-'.join(job['controllers']),
+        'seed': job['seed'],
+        'rows': config['rows'],
+        'cols': config['cols'],
+        'randomizer': config['randomizer'],
+        'sim_hz': job['sim_hz'],
+        'ticks': result['ticks'],
+        'winner': result['winner'] if job['players'] > 1 else None,
+        'results': result['stats']
+    }
+
+
+def finished_games(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if 'error' not in result:
+                    done.add((result['seed'], result['players']))
+    return done
+
+
+def summary(path):
+    modes = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if 'error' in result:
+                continue
+            mode = modes.setdefault(result['players'], {'games': 0, 'lines': 0, 'score': 0, 'pieces': 0, 'wins': {}})
+            mode['games'] += 1
+            for stat in result['stats']:
+                mode['lines'] += stat['lines']
+                mode['score'] += stat['score']
+                mode['pieces'] += stat['pieces']
+            winner = result['stats'][result['winner']]['controller']
+            mode['wins'][winner] = mode['wins'].get(winner, 0) + 1
+    for players, mode in sorted(modes.items()):
+        per_player = mode['games'] * players
+        print('%d player: games=%d lines=%.1f score=%.1f pieces=%.1f wins=%s' % (
+            players, mode['games'], mode['lines'] / per_player, mode['score'] / per_player,
+            mode['pieces'] / per_player, mode['wins']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='play seeded bot/scripted games on a process pool')
+    parser.add_argument('--games', type=int, default=100, help='games per player count')
+    parser.add_argument('--players', type=int, nargs='+', default=[1])
+    parser.add_argument('--controllers', nargs='+', default=['bot'], choices=sorted(controllers),
+                        help='assigned to the players in turn')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sim-hz', type=int, default=config['sim_hz'])
+    parser.add_argument('--every', type=int, default=6, help='ticks between controller actions')
+    parser.add_argument('--max-seconds', type=float, default=300, help='game time limit')
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--budget', type=float, default=None)
+    parser.add_argument('--beam', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='results.jsonl')
+    parser.add_argument('--resume', action='store_true', help='keep the results file and skip its games')
+    parser.add_argument('--db', help='also record the games in this scores.py database')
+    args = parser.parse_args()
+
+    store = Store(args.db) if args.db else None
+
+    done = finished_games(args.out) if args.resume else set()
+    jobs = job_list(args, done)
+    workers = args.workers or os.cpu_count()
+    count = 0
+    start = time.perf_counter()
+    # only a few games in flight at once, results are written and dropped as they come in
+    with ProcessPoolExecutor(workers) as pool, open(args.out, 'a' if args.resume else 'w') as out:
+        pending = {}
+        while True:
+            for job in jobs:
+                pending[pool.submit(play, job)] = job
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            finished, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    print('worker pool died, rerun with --resume to finish')
+                    if store:
+                        store.close()
+                    return
+                except Exception as e:
+                    result = {'seed': job['seed'], 'players': job['players'], 'error': repr(e)}
+                else:
+                    if store:
+                        store.record(store_record(job, result))
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                count += 1
+    print('%d games in %.1fs' % (count, time.perf_counter() - start))
+    if store:
+        store.close()
+    summary(args.out)
+
+
+if __name__ == "__main__":
+    main()